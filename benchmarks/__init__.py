@@ -0,0 +1 @@
+"""Benchmarks of torrent client access against in-process fake Transmission and qBittorrent servers."""
@@ -0,0 +1,106 @@
+import argparse
+import json
+import multiprocessing
+import sys
+from typing import Any
+
+from benchmarks.scenarios import SCENARIOS, run_scenario
+from benchmarks.servers import DEFAULT_ACTIVE_RATIO, make_server
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+DEFAULT_OPS = 20
+DEFAULT_TRACKED = 100
+SCENARIO_TIMEOUT = 600
+# column name, width and number format of the text report
+COLUMNS = [
+    ("backend", 12, ""),
+    ("size", 6, ""),
+    ("scenario", 12, ""),
+    ("ops", 4, ""),
+    ("wall_s", 8, ".3f"),
+    ("op_ms", 8, ".2f"),
+    ("rpc", 5, ""),
+    ("sent_kib", 10, ".1f"),
+    ("recv_kib", 10, ".1f"),
+    ("rss_mib", 8, ".1f"),
+]
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark torrent client access against local fake Transmission and qBittorrent servers",
+    )
+    parser.add_argument("--backend", choices=["transmission", "qbittorrent"], action="append", help="default: both")
+    parser.add_argument("--size", type=int, action="append", help=f"library size, default: {DEFAULT_SIZES}")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append", help="default: all")
+    parser.add_argument("--ops", type=int, default=DEFAULT_OPS, help="operations per scenario")
+    parser.add_argument("--tracked", type=int, default=DEFAULT_TRACKED, help="torrents tracked by the poll scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="server latency per request in seconds")
+    parser.add_argument("--active-ratio", type=float, default=DEFAULT_ACTIVE_RATIO, help="share of active torrents")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per line")
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace, backend: str, size: int, scenario: str) -> dict[str, Any]:
+    """Run scenario in a fresh process, the server is fresh too because add and remove change the library"""
+    server = make_server(backend, size, latency=args.latency, active_ratio=args.active_ratio)
+    context = multiprocessing.get_context("spawn")
+    conn, child_conn = context.Pipe()
+    process = context.Process(
+        target=run_scenario, args=(child_conn, scenario, backend, server.port, args.ops, args.tracked), daemon=True
+    )
+    row: dict[str, Any] = {"backend": backend, "size": size, "scenario": scenario, "ops": args.ops}
+    try:
+        process.start()
+        child_conn.close()
+        ready = conn.recv() if conn.poll(SCENARIO_TIMEOUT) else {"error": "setup timeout"}
+        if ready != "ready":
+            row["error"] = ready["error"] if isinstance(ready, dict) else f"unexpected message {ready!r}"
+            return row
+        server.reset_counters()
+        conn.send("go")
+        message: dict[str, Any] = conn.recv() if conn.poll(SCENARIO_TIMEOUT) else {"error": "run timeout"}
+        counters = server.get_counters()
+        if "error" in message:
+            row["error"] = message["error"]
+            return row
+        row.update(
+            wall_s=message["wall"],
+            op_ms=message["wall"] * 1000 / max(args.ops, 1),
+            rpc=counters["requests"],
+            sent_kib=counters["bytes_received"] / 1024,
+            recv_kib=counters["bytes_sent"] / 1024,
+            rss_mib=message["peak_rss"] / 2**20,
+        )
+        return row
+    finally:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+        server.stop()
+
+
+def format_row(row: dict[str, Any]) -> str:
+    cells = []
+    for name, width, spec in COLUMNS:
+        if name not in row:
+            return " ".join(cells) + f"  error: {row.get('error')}"
+        cells.append(f"{row[name]:>{width}{spec}}")
+    return " ".join(cells)
+
+
+def main() -> None:
+    args = get_args()
+    if not args.json:
+        sys.stdout.write(" ".join(f"{name:>{width}}" for name, width, _ in COLUMNS) + "\n")
+    for backend in args.backend or ["transmission", "qbittorrent"]:
+        for size in args.size or DEFAULT_SIZES:
+            for scenario in args.scenario or list(SCENARIOS):
+                row = run(args, backend, size, scenario)
+                sys.stdout.write((json.dumps(row) if args.json else format_row(row)) + "\n")
+                sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
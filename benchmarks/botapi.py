@@ -0,0 +1,184 @@
+import http.client
+import json
+import socket
+import threading
+import time
+from http import HTTPStatus
+from time import perf_counter
+from typing import Any, cast
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.servers import FakeHandler, FakeServer, Library
+
+BOT_ID = 1000
+WEBHOOK_TIMEOUT = 10.0
+# getUpdates long polls at most this long, so the server shuts down quickly
+MAX_POLL_TIMEOUT = 10.0
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix socket, what a reverse proxy in front of the webhook listener does"""
+
+    def __init__(self, path: str, timeout: float = WEBHOOK_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class FakeBotApi(FakeServer):
+    """Telegram Bot API subset used by the bot, delivering updates through getUpdates or a webhook.
+
+    Outgoing bot calls are recorded with their arrival time, so update to reply latency can be measured.
+    """
+
+    def __init__(self, latency: float = 0.0, unix: str | None = None):
+        # the bot api has no torrents, the empty library only satisfies FakeServer
+        super().__init__(BotApiHandler, Library(0), latency)
+        self.unix = unix
+        self.condition = threading.Condition()
+        self.updates: list[dict[str, Any]] = []
+        self.calls: list[tuple[float, str, dict[str, Any]]] = []
+        self.webhook: dict[str, str] | None = None
+        self.next_update_id = 1
+        self.next_message_id = 1
+
+    def record(self, method: str, params: dict[str, Any]) -> None:
+        with self.condition:
+            self.calls.append((perf_counter(), method, params))
+            self.condition.notify_all()
+
+    def get_calls(self, method: str) -> list[tuple[float, dict[str, Any]]]:
+        with self.condition:
+            return [(at, params) for at, name, params in self.calls if name == method]
+
+    def wait_for_calls(self, method: str, count: int, timeout: float) -> list[tuple[float, dict[str, Any]]]:
+        """Wait until the bot made count calls of method, raise TimeoutError otherwise"""
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: sum(1 for _, name, _ in self.calls if name == method) >= count, timeout
+            ):
+                raise TimeoutError(f"Bot made fewer than {count} {method} calls in {timeout} seconds")
+        return self.get_calls(method)
+
+    def push(self, update: dict[str, Any], secret_token: str | None = None) -> int:
+        """Deliver update like Telegram does, return the webhook response status or 200 when it is queued.
+
+        The configured secret token is sent unless secret_token overrides it.
+        """
+        with self.condition:
+            update = {"update_id": self.next_update_id, **update}
+            self.next_update_id += 1
+            webhook = self.webhook
+            if webhook is None:
+                self.updates.append(update)
+                self.condition.notify_all()
+                return HTTPStatus.OK
+        return self.deliver(webhook, update, secret_token)
+
+    def deliver(self, webhook: dict[str, str], update: dict[str, Any], secret_token: str | None) -> int:
+        url = urlparse(webhook["url"])
+        if self.unix:
+            connection: http.client.HTTPConnection = UnixHTTPConnection(self.unix)
+        else:
+            connection = http.client.HTTPConnection(url.hostname or "127.0.0.1", url.port, timeout=WEBHOOK_TIMEOUT)
+        headers = {"Content-Type": "application/json"}
+        token = webhook.get("secret_token") if secret_token is None else secret_token
+        if token:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = token
+        try:
+            connection.request("POST", url.path or "/", body=json.dumps(update).encode(), headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def get_updates(self, offset: int, timeout: float) -> list[dict[str, Any]]:
+        with self.condition:
+            # confirmed updates are not sent again
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            self.condition.wait_for(lambda: bool(self.updates), min(timeout, MAX_POLL_TIMEOUT))
+            return list(self.updates)
+
+    def make_message(self, chat_id: int, text: str) -> dict[str, Any]:
+        with self.condition:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "Benchmark"},
+            "text": text,
+        }
+
+
+class BotApiHandler(FakeHandler):
+    """Bot API methods as POST /bot<token>/<method> with form, JSON or query parameters"""
+
+    @property
+    def bot_api(self) -> FakeBotApi:
+        return cast(FakeBotApi, self.server)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self.handle_call(b"")
+
+    def do_POST(self) -> None:  # noqa: N802
+        self.handle_call(self.read_body())
+
+    def handle_call(self, body: bytes) -> None:
+        url = urlparse(self.path)
+        method = url.path.rsplit("/", 1)[-1]
+        params: dict[str, Any] = {key: values[0] for key, values in parse_qs(url.query).items()}
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json") and body:
+            params.update(json.loads(body))
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            params.update({key: values[0] for key, values in parse_qs(body.decode()).items()})
+        self.bot_api.record(method, params)
+
+        try:
+            result = self.call(method, params)
+        except (KeyError, ValueError) as exc:
+            response = {"ok": False, "error_code": 400, "description": f"Bad Request: {type(exc).__name__}({exc})"}
+            self.reply(json.dumps(response).encode(), len(body), HTTPStatus.BAD_REQUEST)
+            return
+        self.reply(json.dumps({"ok": True, "result": result}).encode(), len(body))
+
+    def call(self, method: str, params: dict[str, Any]) -> Any:
+        api = self.bot_api
+        if method == "getMe":
+            return {
+                "id": BOT_ID,
+                "is_bot": True,
+                "first_name": "Benchmark",
+                "username": "benchmark_bot",
+                "can_join_groups": False,
+                "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }
+        if method == "getUpdates":
+            return api.get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)))
+        if method == "setWebhook":
+            with api.condition:
+                api.webhook = {"url": params["url"], "secret_token": params.get("secret_token", "")}
+            return True
+        if method == "deleteWebhook":
+            with api.condition:
+                api.webhook = None
+            return True
+        if method == "getWebhookInfo":
+            webhook = api.webhook or {}
+            return {"url": webhook.get("url", ""), "has_custom_certificate": False, "pending_update_count": 0}
+        if method in ("sendMessage", "editMessageText"):
+            return api.make_message(int(params["chat_id"]), str(params["text"]))
+        return True
+
+
+def make_bot_api(latency: float = 0.0, unix: str | None = None) -> FakeBotApi:
+    """Start fake Bot API server, webhook updates go to the unix socket when one is given"""
+    return FakeBotApi(latency, unix).start()
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import resource
+import sys
+import tempfile
+from multiprocessing.connection import Connection
+from pathlib import Path
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Any
+
+from torrent_telegram_bot import bot
+from torrent_telegram_bot.cache import TorrentCache
+from torrent_telegram_bot.config import Acl, Chat, Permission
+from torrent_telegram_bot.custom_types import FIELDS_ALL
+from torrent_telegram_bot.db import DB
+from torrent_telegram_bot.qbittorrent import Qbittorrent
+from torrent_telegram_bot.registry import ClientRegistry
+from torrent_telegram_bot.store import TokenStore
+from torrent_telegram_bot.transmission import Transmission
+
+CHAT_ID = 1
+BACKENDS = {"transmission": Transmission, "qbittorrent": Qbittorrent}
+
+
+class FakeBot:
+    """Telegram bot stand-in that only counts outgoing messages"""
+
+    def __init__(self):
+        self.messages = 0
+        self.sent_bytes = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any) -> None:
+        self.messages += 1
+        self.sent_bytes += len(text.encode())
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.messages = 0
+
+    async def send(self, chat_ids: list[int], text: str) -> None:
+        self.messages += len(chat_ids)
+
+
+def bencode(value: Any) -> bytes:
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(item) for item in value) + b"e"
+    return b"d" + b"".join(bencode(key) + bencode(value[key]) for key in sorted(value)) + b"e"
+
+
+def make_torrent_file(index: int, pieces: int = 64) -> bytes:
+    """Synthetic single file torrent, unique per index"""
+    name = f"benchmark-upload-{index:06d}.mkv".encode()
+    pieces_hash = b"".join(
+        hashlib.sha1(name + bytes([piece % 256]), usedforsecurity=False).digest() for piece in range(pieces)
+    )
+    info = {b"name": name, b"length": pieces * 2**20, b"piece length": 2**20, b"pieces": pieces_hash}
+    return bencode({b"announce": b"http://tracker.invalid/announce", b"info": info})
+
+
+def pick(items: list[str], count: int) -> list[str]:
+    """Spread count picks evenly over items, so runs are reproducible"""
+    if not items:
+        return []
+    return [items[index * len(items) // count % len(items)] for index in range(count)]
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes.
+
+    On Linux ru_maxrss keeps the high-water mark of the forked parent across exec, VmHWM does not.
+    """
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Scenario:
+    """Benchmark scenario run in a fresh process against a fake torrent client server.
+
+    setup() is not measured, run() is timed once and performs ops operations.
+    """
+
+    def __init__(self, backend: str, port: int, ops: int, tracked: int, workdir: Path):
+        self.backend_name = backend
+        self.port = port
+        self.ops = ops
+        self.tracked = tracked
+        self.workdir = workdir
+        self.backend: Transmission | Qbittorrent
+        self.ids: list[str] = []
+        self.downloading: list[str] = []
+        self.context = SimpleNamespace(bot=FakeBot(), bot_data={}, job_queue=None)
+
+    def make_backend(self) -> Transmission | Qbittorrent:
+        return BACKENDS[self.backend_name](address="127.0.0.1", port=self.port)
+
+    async def setup(self) -> None:
+        self.backend = self.make_backend()
+        torrents = sorted(await self.backend.get_torrents(FIELDS_ALL))
+        self.ids = [torrent.torrent_id for torrent in torrents]
+        self.downloading = [torrent.torrent_id for torrent in torrents if not torrent.done]
+
+    async def run(self) -> None:
+        raise NotImplementedError
+
+    async def teardown(self) -> None:
+        self.backend.close()
+
+    def use_bot(self, permission: Permission = "all") -> None:
+        """Point the bot module globals at the fake server, the cache is disabled so every call hits the client"""
+        bot.cfg = {"telegram": {"page_size": bot.DEFAULT_PAGE_SIZE}, "db": {}, "schedule": {}}
+        bot.acl = Acl([Chat(CHAT_ID, permission, "personal")])
+        bot.client = ClientRegistry({"default": TorrentCache(self.backend, ttl=0)})
+
+
+class FullSync(Scenario):
+    """Transmission.get_torrents / Qbittorrent.get_torrents with an empty mirror, a full library fetch"""
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.backends = [self.make_backend() for _ in range(self.ops)]
+
+    async def run(self) -> None:
+        for backend in self.backends:
+            await backend.get_torrents(FIELDS_ALL)
+
+    async def teardown(self) -> None:
+        for backend in self.backends:
+            backend.close()
+        await super().teardown()
+
+
+class DeltaSync(Scenario):
+    """get_torrents against a warm mirror, only the change feed is transferred"""
+
+    async def run(self) -> None:
+        for _ in range(self.ops):
+            await self.backend.get_torrents(FIELDS_ALL)
+
+
+class GetTorrent(Scenario):
+    """get_torrent of single torrents by id"""
+
+    async def run(self) -> None:
+        for torrent_id in pick(self.ids, self.ops):
+            await self.backend.get_torrent(torrent_id)
+
+
+class ListTorrents(Scenario):
+    """list_torrent_action for a chat allowed to see every torrent"""
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.use_bot("all")
+        self.context.bot_data["lists"] = TokenStore()
+        self.update = SimpleNamespace(effective_chat=SimpleNamespace(id=CHAT_ID))
+        await bot.list_torrent_action(self.update, self.context, type="all")
+
+    async def run(self) -> None:
+        for _ in range(self.ops):
+            await bot.list_torrent_action(self.update, self.context, type="all")
+
+
+class StatusPoll(Scenario):
+    """check_torrent_download_status with downloading torrents added through the bot, none finishes during the run"""
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.use_bot("personal")
+        self.db = await DB.create(str(self.workdir / "benchmark.db"))
+        await self.db.add_torrents(CHAT_ID, [(torrent_id, None) for torrent_id in pick(self.downloading, self.tracked)])
+        self.context.bot_data.update(db=self.db, outbox=FakeOutbox())
+
+    async def run(self) -> None:
+        for _ in range(self.ops):
+            await bot.check_torrent_download_status(self.context)
+
+    async def teardown(self) -> None:
+        await self.db.close()
+        await super().teardown()
+
+
+class AddTorrent(Scenario):
+    """add_torrent of torrent files not known to the client"""
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.files = [make_torrent_file(index) for index in range(self.ops)]
+
+    async def run(self) -> None:
+        for data in self.files:
+            await self.backend.add_torrent(data, download_dir="/downloads")
+
+
+class RemoveTorrent(Scenario):
+    """remove_torrent of existing torrents"""
+
+    async def run(self) -> None:
+        for torrent_id in self.ids[: self.ops]:
+            await self.backend.remove_torrent(torrent_id)
+
+
+SCENARIOS: dict[str, type[Scenario]] = {
+    "full-sync": FullSync,
+    "delta-sync": DeltaSync,
+    "get-torrent": GetTorrent,
+    "list": ListTorrents,
+    "poll": StatusPoll,
+    "add": AddTorrent,
+    "remove": RemoveTorrent,
+}
+
+
+def run_scenario(conn: Connection, name: str, backend: str, port: int, ops: int, tracked: int) -> None:
+    """Process entry point, the parent resets server counters between setup and the timed run"""
+
+    async def main() -> dict[str, Any]:
+        with tempfile.TemporaryDirectory() as workdir:
+            scenario = SCENARIOS[name](backend, port, ops, tracked, Path(workdir))
+            await scenario.setup()
+            try:
+                conn.send("ready")
+                conn.recv()
+                start = perf_counter()
+                await scenario.run()
+                wall = perf_counter() - start
+            finally:
+                await scenario.teardown()
+            return {"wall": wall, "peak_rss": peak_rss(), "messages": scenario.context.bot.messages}
+
+    try:
+        conn.send(asyncio.run(main()))
+    except Exception as exc:
+        conn.send({"error": f"{type(exc).__name__}({exc})"})
+    finally:
+        conn.close()
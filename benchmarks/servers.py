@@ -0,0 +1,382 @@
+import hashlib
+import json
+import threading
+import time
+from base64 import b64decode
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Self, cast
+from urllib.parse import parse_qs, urlparse
+
+from torrent_telegram_bot.metainfo import MetainfoError, parse_magnet, parse_torrent
+
+# share of the library that is downloading and changes between two polls
+DEFAULT_ACTIVE_RATIO = 0.02
+TRANSMISSION_SESSION_ID = "benchmark"
+TRANSMISSION_RPC_VERSION = 17
+QBITTORRENT_VERSION = "v5.0.0"
+QBITTORRENT_API_VERSION = "2.11.2"
+
+
+class Library:
+    """Synthetic torrent library shared by the fake servers.
+
+    Torrents are kept as neutral records and rendered in the field names of each client. Every poll moves the
+    active torrents forward, so change feeds always have something to report.
+    """
+
+    def __init__(self, size: int, active_ratio: float = DEFAULT_ACTIVE_RATIO):
+        self.lock = threading.Lock()
+        self.torrents: dict[int, dict[str, Any]] = {}
+        self.hashes: dict[str, int] = {}
+        self.removed: list[tuple[int, dict[str, Any]]] = []
+        self.revision = 0
+        self.next_id = 1
+        active_every = max(int(1 / active_ratio), 1) if active_ratio > 0 else 0
+        for index in range(size):
+            info_hash = hashlib.sha1(f"torrent {index}".encode(), usedforsecurity=False).hexdigest()
+            self.add(
+                info_hash,
+                f"Benchmark torrent {index:06d}",
+                2**30,
+                active=bool(active_every) and not index % active_every,
+            )
+
+    def add(self, info_hash: str, name: str, size: int, active: bool = True) -> dict[str, Any]:
+        """Add torrent or return the one with the same info hash"""
+        if info_hash in self.hashes:
+            return self.torrents[self.hashes[info_hash]]
+        torrent = {
+            "id": self.next_id,
+            "hash": info_hash,
+            "name": name,
+            "size": size,
+            "progress": 0.5 if active else 1.0,
+            "done_date": 0 if active else int(time.time()) - 86400,
+            "rate": 1024 * 1024 if active else 0,
+            "revision": self.revision,
+        }
+        self.torrents[torrent["id"]] = torrent
+        self.hashes[info_hash] = torrent["id"]
+        self.next_id += 1
+        return torrent
+
+    def remove(self, torrent_id: int) -> None:
+        torrent = self.torrents.pop(torrent_id, None)
+        if torrent is not None:
+            del self.hashes[torrent["hash"]]
+            # the removal is reported by the next revision, like any other change
+            self.removed.append((self.revision + 1, torrent))
+
+    def tick(self) -> int:
+        """Advance active torrents by one step and return the new revision"""
+        self.revision += 1
+        for torrent in self.torrents.values():
+            if torrent["rate"]:
+                torrent["progress"] = min(torrent["progress"] + 0.001, 0.999)
+                torrent["revision"] = self.revision
+        return self.revision
+
+    def changed_since(self, revision: int) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """Torrents changed and removed after revision"""
+        torrents = [torrent for torrent in self.torrents.values() if torrent["revision"] > revision]
+        removed = [torrent for removed_at, torrent in self.removed if removed_at > revision]
+        return torrents, removed
+
+    @staticmethod
+    def eta(torrent: dict[str, Any]) -> int:
+        if not torrent["rate"]:
+            return -1
+        return int(torrent["size"] * (1 - torrent["progress"]) / torrent["rate"])
+
+    def add_data(self, data: bytes | str) -> dict[str, Any]:
+        """Add torrent file content or magnet link"""
+        metainfo = parse_magnet(data) if isinstance(data, str) else parse_torrent(data)
+        return self.add(metainfo.info_hash, metainfo.name, metainfo.size or 2**30)
+
+
+class FakeServer(ThreadingHTTPServer):
+    """HTTP server running in a background thread that counts requests and transferred bytes"""
+
+    daemon_threads = True
+
+    def __init__(self, handler: type[BaseHTTPRequestHandler], library: Library, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.library = library
+        self.latency = latency
+        self.counter_lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def count(self, received: int, sent: int) -> None:
+        with self.counter_lock:
+            self.requests += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def reset_counters(self) -> None:
+        with self.counter_lock:
+            self.requests = self.bytes_received = self.bytes_sent = 0
+
+    def get_counters(self) -> dict[str, int]:
+        with self.counter_lock:
+            return {"requests": self.requests, "bytes_received": self.bytes_received, "bytes_sent": self.bytes_sent}
+
+    def start(self) -> Self:
+        self.thread = threading.Thread(target=self.serve_forever, name=type(self).__name__.lower(), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, with Nagle every response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    @property
+    def fake_server(self) -> FakeServer:
+        return cast(FakeServer, self.server)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def reply(
+        self,
+        body: bytes,
+        received: int,
+        status: HTTPStatus = HTTPStatus.OK,
+        content_type: str = "application/json",
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        if self.fake_server.latency:
+            time.sleep(self.fake_server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        # transferred bytes include the request line and headers of both directions
+        received += len(self.requestline) + 2 + len(self.headers.as_bytes())
+        # BaseHTTPRequestHandler buffers the status line and headers until end_headers
+        sent = sum(len(line) for line in getattr(self, "_headers_buffer", [])) + 2 + len(body)
+        self.end_headers()
+        self.wfile.write(body)
+        self.fake_server.count(received, sent)
+
+
+class TransmissionHandler(FakeHandler):
+    """Transmission JSON-RPC subset used by the bot: session-get, torrent-get, torrent-add and torrent-remove"""
+
+    FIELDS = {
+        "id": lambda torrent: torrent["id"],
+        "hashString": lambda torrent: torrent["hash"],
+        "name": lambda torrent: torrent["name"],
+        "status": lambda torrent: 4 if torrent["rate"] else 6,
+        "doneDate": lambda torrent: torrent["done_date"],
+        "eta": Library.eta,
+        "percentDone": lambda torrent: torrent["progress"],
+        "rateDownload": lambda torrent: torrent["rate"],
+        "rateUpload": lambda torrent: 0,
+        "peersSendingToUs": lambda torrent: 5 if torrent["rate"] else 0,
+        "peersGettingFromUs": lambda torrent: 0,
+        "uploadRatio": lambda torrent: 0.0,
+    }
+
+    def do_POST(self) -> None:  # noqa: N802
+        body = self.read_body()
+        if self.headers.get("X-Transmission-Session-Id") != TRANSMISSION_SESSION_ID:
+            self.reply(
+                b"", len(body), HTTPStatus.CONFLICT, headers={"X-Transmission-Session-Id": TRANSMISSION_SESSION_ID}
+            )
+            return
+        request = json.loads(body)
+        try:
+            arguments = self.call(request["method"], request.get("arguments") or {})
+        except (KeyError, MetainfoError) as exc:
+            response = {"result": f"{type(exc).__name__}({exc})", "arguments": {}}
+        else:
+            response = {"result": "success", "arguments": arguments}
+        self.reply(json.dumps(response).encode(), len(body))
+
+    def call(self, method: str, arguments: dict[str, Any]) -> dict[str, Any]:
+        library = self.fake_server.library
+        with library.lock:
+            if method == "session-get":
+                return {"rpc-version": TRANSMISSION_RPC_VERSION, "rpc-version-semver": "5.3.0", "version": "4.0.0"}
+            if method == "torrent-get":
+                return self.torrent_get(library, arguments)
+            if method == "torrent-add":
+                if "metainfo" in arguments:
+                    torrent = library.add_data(b64decode(arguments["metainfo"]))
+                else:
+                    torrent = library.add_data(arguments["filename"])
+                return {"torrent-added": self.render(torrent, ["id", "name", "hashString"])}
+            if method == "torrent-remove":
+                for torrent_id in self.get_ids(library, arguments.get("ids")):
+                    library.remove(torrent_id)
+                return {}
+        raise KeyError(method)
+
+    def torrent_get(self, library: Library, arguments: dict[str, Any]) -> dict[str, Any]:
+        fields = [field for field in arguments.get("fields", []) if field in self.FIELDS]
+        ids = arguments.get("ids")
+        if ids == "recently-active":
+            # every poll sees the changes of one step, transmission reports those of the last 60 seconds
+            revision = library.revision
+            library.tick()
+            torrents, removed = library.changed_since(revision)
+            return {
+                "torrents": [self.render(torrent, fields) for torrent in torrents],
+                "removed": [torrent["id"] for torrent in removed],
+            }
+        library.tick()
+        torrents = [library.torrents[torrent_id] for torrent_id in self.get_ids(library, ids)]
+        return {"torrents": [self.render(torrent, fields) for torrent in torrents]}
+
+    @staticmethod
+    def get_ids(library: Library, ids: Any) -> list[int]:
+        if ids is None:
+            return list(library.torrents)
+        if not isinstance(ids, list):
+            ids = [ids]
+        result = []
+        for torrent_id in ids:
+            if isinstance(torrent_id, str):
+                torrent_id = library.hashes.get(torrent_id)
+            if torrent_id in library.torrents:
+                result.append(torrent_id)
+        return result
+
+    def render(self, torrent: dict[str, Any], fields: list[str]) -> dict[str, Any]:
+        return {field: self.FIELDS[field](torrent) for field in fields}
+
+
+class QbittorrentHandler(FakeHandler):
+    """qBittorrent WebAPI subset used by the bot: login, torrents/info, sync/maindata, torrents/add and delete"""
+
+    # fields render() never changes for a torrent, partial maindata updates leave them out like qBittorrent does
+    STATIC_FIELDS = frozenset({"hash", "name", "size", "upspeed", "num_leechs", "ratio"})
+
+    def do_GET(self) -> None:  # noqa: N802
+        self.handle_call(b"")
+
+    def do_POST(self) -> None:  # noqa: N802
+        self.handle_call(self.read_body())
+
+    def handle_call(self, body: bytes) -> None:
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            params.update({key: values[0] for key, values in parse_qs(body.decode()).items()})
+        files: list[bytes] = []
+        if content_type.startswith("multipart/form-data"):
+            message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+            for part in message.iter_parts():
+                payload = part.get_payload(decode=True)
+                if not isinstance(payload, bytes):
+                    payload = b""
+                if part.get_filename() is not None:
+                    files.append(payload)
+                elif part.get_param("name", header="content-disposition"):
+                    params[str(part.get_param("name", header="content-disposition"))] = payload.decode()
+
+        endpoint = url.path.removeprefix("/api/v2/")
+        library = self.fake_server.library
+        with library.lock:
+            if endpoint == "auth/login":
+                self.reply(
+                    b"Ok.", len(body), content_type="text/plain", headers={"Set-Cookie": "SID=benchmark; path=/"}
+                )
+            elif endpoint == "app/version":
+                self.reply(QBITTORRENT_VERSION.encode(), len(body), content_type="text/plain")
+            elif endpoint == "app/webapiVersion":
+                self.reply(QBITTORRENT_API_VERSION.encode(), len(body), content_type="text/plain")
+            elif endpoint == "torrents/info":
+                hashes = params.get("hashes")
+                if hashes:
+                    torrent_ids = [library.hashes[h] for h in hashes.split("|") if h in library.hashes]
+                else:
+                    torrent_ids = list(library.torrents)
+                library.tick()
+                torrents = [self.render(library.torrents[torrent_id]) for torrent_id in torrent_ids]
+                self.reply(json.dumps(torrents).encode(), len(body))
+            elif endpoint == "sync/maindata":
+                self.reply(json.dumps(self.maindata(library, int(params.get("rid", 0)))).encode(), len(body))
+            elif endpoint == "torrents/add":
+                try:
+                    for url_value in filter(None, params.get("urls", "").split("\n")):
+                        library.add_data(url_value.strip())
+                    for data in files:
+                        library.add_data(data)
+                except MetainfoError:
+                    self.reply(b"Fails.", len(body), content_type="text/plain")
+                else:
+                    self.reply(b"Ok.", len(body), content_type="text/plain")
+            elif endpoint == "torrents/delete":
+                for info_hash in params.get("hashes", "").split("|"):
+                    if info_hash in library.hashes:
+                        library.remove(library.hashes[info_hash])
+                self.reply(b"", len(body), content_type="text/plain")
+            else:
+                self.reply(b"Not Found", len(body), HTTPStatus.NOT_FOUND, content_type="text/plain")
+
+    def maindata(self, library: Library, rid: int) -> dict[str, Any]:
+        """Full update for rid 0, otherwise only the changed fields of torrents changed since rid"""
+        library.tick()
+        if rid == 0 or rid > library.revision:
+            torrents = {torrent["hash"]: self.render(torrent) for torrent in library.torrents.values()}
+            data = {"full_update": True, "torrents": torrents}
+        else:
+            changed, removed = library.changed_since(rid)
+            data = {
+                "torrents": {
+                    torrent["hash"]: {
+                        field: value for field, value in self.render(torrent).items() if field not in self.STATIC_FIELDS
+                    }
+                    for torrent in changed
+                },
+                "torrents_removed": [torrent["hash"] for torrent in removed],
+            }
+        data["rid"] = library.revision
+        return data
+
+    @staticmethod
+    def render(torrent: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "hash": torrent["hash"],
+            "name": torrent["name"],
+            "size": torrent["size"],
+            "state": "downloading" if torrent["rate"] else "uploading",
+            "completion_on": torrent["done_date"] or -1,
+            "eta": Library.eta(torrent) if torrent["rate"] else 8640000,
+            "progress": torrent["progress"],
+            "dlspeed": torrent["rate"],
+            "upspeed": 0,
+            "num_seeds": 5 if torrent["rate"] else 0,
+            "num_leechs": 0,
+            "ratio": 0.0,
+        }
+
+
+def make_server(
+    backend: str, size: int, latency: float = 0.0, active_ratio: float = DEFAULT_ACTIVE_RATIO
+) -> FakeServer:
+    """Start fake torrent client server of the given backend type with a library of size torrents"""
+    handlers = {"transmission": TransmissionHandler, "qbittorrent": QbittorrentHandler}
+    return FakeServer(handlers[backend], Library(size, active_ratio), latency).start()
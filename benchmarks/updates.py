@@ -0,0 +1,210 @@
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from http import HTTPStatus
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+import yaml
+
+from benchmarks.botapi import FakeBotApi, make_bot_api
+from benchmarks.servers import make_server
+
+MODES = ["polling", "webhook", "webhook-unix"]
+CHAT_ID = 111111111
+TOKEN = "1000:benchmark"  # noqa: S105
+SECRET_TOKEN = "benchmark-secret"  # noqa: S105
+DEFAULT_UPDATES = 50
+DEFAULT_BURST = 20
+DEFAULT_LIBRARY_SIZE = 100
+STARTUP_TIMEOUT = 30.0
+REPLY_TIMEOUT = 30.0
+STOP_TIMEOUT = 10.0
+# column name, width and number format of the text report
+COLUMNS = [
+    ("mode", 12, ""),
+    ("updates", 7, ""),
+    ("p50_ms", 8, ".2f"),
+    ("p95_ms", 8, ".2f"),
+    ("max_ms", 8, ".2f"),
+    ("burst", 5, ""),
+    ("burst_s", 8, ".3f"),
+    ("spoofed", 7, ""),
+]
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.updates",
+        description="Run the bot end to end against a local fake Bot API server and measure update to reply latency",
+    )
+    parser.add_argument("--mode", choices=MODES, action="append", help="default: all")
+    parser.add_argument("--updates", type=int, default=DEFAULT_UPDATES, help="updates sent one after another")
+    parser.add_argument("--burst", type=int, default=DEFAULT_BURST, help="updates sent at once")
+    parser.add_argument("--latency", type=float, default=0.0, help="Bot API latency per request in seconds")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per line")
+    return parser.parse_args()
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_config(workdir: Path, mode: str, api_port: int, client_port: int) -> Path:
+    """Bot config pointing at the fake servers, webhook modes listen on a free port or a unix socket"""
+    config: dict[str, Any] = {
+        "telegram": {
+            "token": TOKEN,
+            "base_url": f"http://127.0.0.1:{api_port}",
+            "allow_chat": [{"telegram_id": CHAT_ID, "torrent_permission": "all", "notify": "none"}],
+        },
+        "client": {
+            "type": "transmission",
+            "address": "127.0.0.1",
+            "port": client_port,
+            "user": "",
+            "password": "",
+            "path": [{"category": "Movies", "dir": "/downloads/Movies"}],
+        },
+        "db": {"path": str(workdir / "bot.db")},
+        "schedule": {"check_period": 60, "config_check_period": 0},
+    }
+    if mode != "polling":
+        port = get_free_port()
+        webhook: dict[str, Any] = {
+            "url": f"http://127.0.0.1:{port}/telegram",
+            "path": "telegram",
+            "secret_token": SECRET_TOKEN,
+        }
+        if mode == "webhook-unix":
+            webhook["unix"] = str(workdir / "webhook.sock")
+        else:
+            webhook.update(listen="127.0.0.1", port=port)
+        config["telegram"]["webhook"] = webhook
+    path = workdir / "config.yml"
+    path.write_text(yaml.safe_dump(config))
+    return path
+
+
+def make_update(text: str) -> dict[str, Any]:
+    user = {"id": CHAT_ID, "is_bot": False, "first_name": "Benchmark"}
+    message = {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": CHAT_ID, "type": "private"},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"message": message}
+
+
+def wait_ready(api: FakeBotApi, mode: str, bot: subprocess.Popen) -> None:
+    """Wait until the bot polls for updates or has registered its webhook and listens"""
+    method = "getUpdates" if mode == "polling" else "setWebhook"
+    deadline = perf_counter() + STARTUP_TIMEOUT
+    while not api.get_calls(method):
+        if bot.poll() is not None:
+            raise RuntimeError(f"Bot exited with code {bot.returncode}")
+        if perf_counter() > deadline:
+            raise TimeoutError(f"Bot did not call {method} in {STARTUP_TIMEOUT} seconds")
+        time.sleep(0.05)
+    # the listener starts right after setWebhook, the first update waits for it
+    time.sleep(0.5)
+
+
+def measure(api: FakeBotApi, mode: str, updates: int, burst: int) -> dict[str, Any]:
+    row: dict[str, Any] = {"mode": mode, "updates": updates, "burst": burst}
+    sent = len(api.get_calls("sendMessage"))
+    latencies = []
+    for _ in range(updates):
+        start = perf_counter()
+        api.push(make_update("/help"))
+        sent += 1
+        replies = api.wait_for_calls("sendMessage", sent, REPLY_TIMEOUT)
+        latencies.append(replies[sent - 1][0] - start)
+    latencies.sort()
+    row.update(
+        p50_ms=statistics.median(latencies) * 1000,
+        p95_ms=latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000,
+        max_ms=latencies[-1] * 1000,
+    )
+
+    start = perf_counter()
+    for _ in range(burst):
+        api.push(make_update("/help"))
+    sent += burst
+    api.wait_for_calls("sendMessage", sent, REPLY_TIMEOUT)
+    row["burst_s"] = perf_counter() - start
+
+    if mode == "polling":
+        row["spoofed"] = "-"
+    else:
+        # an update with a wrong secret token must be rejected and never handled
+        row["spoofed"] = api.push(make_update("/help"), secret_token="wrong-secret")  # noqa: S106
+        time.sleep(0.5)
+        if len(api.get_calls("sendMessage")) != sent:
+            raise RuntimeError("Update with a wrong secret token was handled")
+    return row
+
+
+def run(args: argparse.Namespace, mode: str) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        workdir = Path(directory)
+        client = make_server("transmission", DEFAULT_LIBRARY_SIZE)
+        api = make_bot_api(args.latency, str(workdir / "webhook.sock") if mode == "webhook-unix" else None)
+        config = make_config(workdir, mode, api.port, client.port)
+        with (workdir / "bot.log").open("w") as log:
+            bot = subprocess.Popen(  # noqa: S603
+                [sys.executable, "-m", "torrent_telegram_bot.bot", "-c", str(config)], stdout=log, stderr=log
+            )
+        try:
+            wait_ready(api, mode, bot)
+            row = measure(api, mode, args.updates, args.burst)
+            if row.get("spoofed") not in ("-", HTTPStatus.FORBIDDEN):
+                row["error"] = f"wrong secret token answered with {row['spoofed']}"
+            return row
+        except (RuntimeError, TimeoutError, OSError) as exc:
+            log_tail = (workdir / "bot.log").read_text().strip().splitlines()[-5:]
+            return {"mode": mode, "error": f"{type(exc).__name__}({exc})", "log": log_tail}
+        finally:
+            bot.terminate()
+            try:
+                bot.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+                bot.wait()
+            api.stop()
+            client.stop()
+
+
+def format_row(row: dict[str, Any]) -> str:
+    cells = []
+    for name, width, spec in COLUMNS:
+        if name not in row or "error" in row:
+            return " ".join(cells) + f"  error: {row.get('error')}"
+        cells.append(f"{row[name]:>{width}{spec}}")
+    return " ".join(cells)
+
+
+def main() -> None:
+    args = get_args()
+    if not args.json:
+        sys.stdout.write(" ".join(f"{name:>{width}}" for name, width, _ in COLUMNS) + "\n")
+    for mode in args.mode or MODES:
+        row = run(args, mode)
+        sys.stdout.write((json.dumps(row) if args.json else format_row(row)) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
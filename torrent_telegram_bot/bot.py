@@ -1,39 +1,113 @@
 import argparse
+import asyncio
+import datetime
+import re
+import signal
 import sys
 import traceback
-from base64 import b64decode, b64encode
-from datetime import datetime
 from functools import wraps
 from pathlib import Path
 from textwrap import dedent
-from typing import Coroutine
-from zoneinfo import ZoneInfo
 
 import sentry_sdk
 from emoji import emojize
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, request
 from telegram.ext import ApplicationBuilder, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+from telegram.helpers import escape_markdown
 
 import torrent_telegram_bot.tools as tools
-from torrent_telegram_bot import _version
+from torrent_telegram_bot import _version, events, metrics
+from torrent_telegram_bot.cache import DEFAULT_TTL, TorrentCache
+from torrent_telegram_bot.client import DEFAULT_WORKERS
+from torrent_telegram_bot.config import Acl, ConfigError, check_config, get_client_configs, get_webhook_config
+from torrent_telegram_bot.custom_types import FIELDS_ALL, FIELDS_NAME, FIELDS_STATUS
 from torrent_telegram_bot.db import DB
+from torrent_telegram_bot.metainfo import MAX_TORRENT_SIZE, MetainfoError, parse_magnet, parse_torrent
+from torrent_telegram_bot.outbox import DEFAULT_CHAT_SEND_RATE, DEFAULT_DIGEST_WINDOW, DEFAULT_SEND_RATE, Outbox
+from torrent_telegram_bot.profiling import (
+    DEFAULT_PROFILE_DIR,
+    DEFAULT_PROFILE_PERIOD,
+    DEFAULT_SLOW_THRESHOLD,
+    Profiler,
+)
 from torrent_telegram_bot.qbittorrent import Qbittorrent
+from torrent_telegram_bot.registry import DEFAULT_CLIENT_TIMEOUT, ClientRegistry
+from torrent_telegram_bot.store import TokenStore
 from torrent_telegram_bot.transmission import Transmission
 
+DEFAULT_DB_READERS = 2
+DEFAULT_DB_MAINTENANCE_PERIOD = 3600
+DEFAULT_PAGE_SIZE = 10
+DELETE_BUTTON_LENGTH = 60
+# uploaded torrent files wait for a category choice in memory, abandoned ones expire.
+# The limit is per chat, the oldest upload of a chat is dropped when it sends more
+UPLOAD_MAXSIZE = 8
+UPLOAD_TTL = 900
+# parsed metainfo of torrents that were never added is kept this many seconds
+METAINFO_RETENTION = 30 * 86400
+# files of one media group are collected until no new file arrived for this many seconds
+MEDIA_GROUP_DELAY = 2
+MAGNET_RE = re.compile(r"magnet:\?\S+")
+MAGNET_LABEL_LENGTH = 60
+DEFAULT_CONFIG_CHECK_PERIOD = 30
+# status checks run every check_period while torrents are pending, sooner when one is about to finish.
+# The default stays within transmission.DELTA_MAX_AGE, so checks only fetch recently active torrents
+DEFAULT_CHECK_PERIOD = 30
+DEFAULT_MIN_CHECK_PERIOD = 5
+DEFAULT_IDLE_CHECK_PERIOD = 600
+# with completion events pushed by the torrent clients status checks only reconcile missed events
+DEFAULT_RECONCILE_PERIOD = 900
+STATUS_FIRST_DELAY = 10
+STATUS_WAKE_DELAY = 1
+STATUS_CHECK_JOB = "check_torrent_download_status"
+DB_MAINTENANCE_JOB = "db_maintenance"
+CONFIG_WATCH_JOB = "watch_config"
+# settings that are only applied on startup
+RESTART_SETTINGS = [
+    ("telegram", "token"),
+    ("telegram", "proxy"),
+    ("telegram", "base_url"),
+    ("telegram", "webhook"),
+    ("db", "path"),
+    ("db", "readers"),
+    ("metrics", "address"),
+    ("metrics", "port"),
+    ("events", "address"),
+    ("events", "port"),
+    ("events", "unix"),
+]
+
+config_lock = asyncio.Lock()
+status_lock = asyncio.Lock()
+profiler: Profiler | None = None
+
+HANDLER_SECONDS = metrics.histogram("telegram_handler_seconds", "Telegram update handler duration", ("handler",))
+HANDLER_ERRORS = metrics.counter("telegram_handler_errors_total", "Telegram update handler exceptions", ("handler",))
+STATUS_CHECK_SECONDS = metrics.histogram("status_check_seconds", "Download status check duration")
+STATUS_CHECK_OVERLAPS = metrics.counter(
+    "status_check_overlaps_total", "Download status checks that had to wait for a running check"
+)
+COMPLETION_EVENTS = metrics.counter(
+    "completion_events_total", "Completion events pushed by torrent clients by result", ("result",)
+)
+
+
+def profiled(func):
+    """Run the coroutine function through the profiler when the bot runs in profile mode"""
+
+    @wraps(func)
+    async def wrapped(*args, **kwargs):
+        if profiler is None:
+            return await func(*args, **kwargs)
+        return await profiler.run(func.__name__, func(*args, **kwargs))
+
+    return wrapped
+
 
 def restricted(func):
     @wraps(func)
     async def wrapped(update, context, *args, **kwargs):
-        chat_id = update.effective_chat.id
-        if "allow_chat" in cfg["telegram"]:
-            if cfg["telegram"]["allow_chat"]:
-                allowed_chat = any(d["telegram_id"] == chat_id for d in cfg["telegram"]["allow_chat"])
-            else:
-                allowed_chat = False
-        else:
-            allowed_chat = False
-
-        if allowed_chat:
+        if update.effective_chat.id in acl:
             return await func(update, context, *args, **kwargs)
         else:
             await context.bot.send_message(
@@ -52,8 +126,19 @@ async def text_message_action(update, context):
         "All": {"func": list_torrent_action, "kwargs": {"type": "all"}},
         "Delete": {"func": delete_torrent_action},
     }
+    text = update.effective_message.text
+    magnets = MAGNET_RE.findall(text)
+    if magnets:
+        context.user_data.pop("delete_search", None)
+        await download_magnet_action(update, context, magnets)
+        return
+    # while a delete search is pending any text but a keyboard button is the search query
+    if context.user_data.pop("delete_search", False) and text not in get_main_keyboard_buttons():
+        await delete_torrent_action(update, context, query=text.strip())
+        return
+
     try:
-        route = next(v for k, v in routes.items() if k in update.effective_message.text)
+        route = next(v for k, v in routes.items() if k in text)
     except Exception:
         await unknown_command_action(update, context)
     else:
@@ -63,156 +148,295 @@ async def text_message_action(update, context):
             await route["func"](update, context)
 
 
-async def get_torrents(update, context, **kwargs):
+async def get_torrents(update, context, fields=FIELDS_ALL, **kwargs):
     global client
     torrents = []
     try:
-        permission = tools.get_torrent_permission(config=cfg, chat_id=update.effective_chat.id)
+        permission = acl.get_permission(update.effective_chat.id)
     except Exception:
         await error_action(update, context)
         return []
     if permission:
         if permission == "personal":
+            db: DB = context.bot_data["db"]
             try:
-                db = await DB.create(cfg["db"]["path"])
+                db_torrents = await db.get_torrent_by_uid(update.effective_chat.id)
             except Exception:
                 await error_action(update, context)
             else:
-                db_torrents = await db.get_torrent_by_uid(update.effective_chat.id)
                 if db_torrents:
-                    for db_entry in db_torrents:
-                        torrent = client.get_torrent(db_entry[1])
-                        torrents.append(torrent)
+                    try:
+                        torrents = await client.get_torrents_by_ids(
+                            (db_entry[1] for db_entry in db_torrents), fields=fields
+                        )
+                    except Exception:
+                        await error_action(update, context)
         elif permission == "all":
-            torrents = client.get_torrents()
+            try:
+                torrents = await client.get_torrents(fields)
+            except Exception:
+                await error_action(update, context)
     return torrents
 
 
 @restricted
 async def download_torrent_action(update, context):
-    keyboard = []
-    file = await context.bot.getFile(update.message.document.file_id)
-    torrent_data = await file.download_as_bytearray()
-    torrent_data = b64encode(torrent_data).decode("utf-8")
-    context.user_data.clear()
-    context.user_data.update({"torrent_data": torrent_data})
-    category = tools.get_torrent_category(config=cfg, chat_id=update.effective_chat.id)
-
-    for client_path in cfg["client"]["path"]:
-        if category:
-            if client_path["category"] in category:
-                keyboard.append(
-                    [
-                        InlineKeyboardButton(
-                            client_path["category"],
-                            callback_data=f"download:{client_path['dir']}",
-                        )
-                    ]
-                )
-        else:
-            keyboard.append(
-                [
-                    InlineKeyboardButton(
-                        client_path["category"],
-                        callback_data=f"download:{client_path['dir']}",
-                    )
-                ]
-            )
-    keyboard.append([InlineKeyboardButton("Cancel", callback_data="download:cancel")])
+    document = update.message.document
+    if (document.file_size or 0) > MAX_TORRENT_SIZE:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"The torrent file {document.file_name} is too large, the limit is "
+            f"{tools.humanize_bytes(MAX_TORRENT_SIZE)}.",
+        )
+        return
+    file = await context.bot.getFile(document.file_id)
+    torrent_data = bytes(await file.download_as_bytearray())
     try:
+        metainfo = parse_torrent(torrent_data)
+    except MetainfoError as exc:
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text="Which Plex category do you want to use for the downloaded torrent?",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            text=f"The file {document.file_name} is not a valid torrent file: {exc}",
         )
-    except Exception:
-        await error_action(update, context)
+        return
+    metainfo = await check_metainfo(context, update.effective_chat.id, metainfo)
+    if metainfo is None:
+        return
+    item = (metainfo, torrent_data)
+
+    if update.message.media_group_id is None or not context.job_queue:
+        await send_category_keyboard(context, update.effective_chat.id, [item])
+        return
+
+    # files of a media group arrive as separate updates, collect them until the group is quiet
+    key = (update.effective_chat.id, update.message.media_group_id)
+    batch = context.bot_data["batches"].setdefault(key, {"items": [], "job": None})
+    batch["items"].append(item)
+    if batch["job"] is not None:
+        batch["job"].schedule_removal()
+    batch["job"] = context.job_queue.run_once(flush_media_group, when=MEDIA_GROUP_DELAY, data=key)
+
+
+async def download_magnet_action(update, context, magnets):
+    items = []
+    for magnet in magnets:
+        try:
+            metainfo = parse_magnet(magnet)
+        except MetainfoError as exc:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=f"The magnet link {magnet[:MAGNET_LABEL_LENGTH]} is not supported: {exc}",
+            )
+            continue
+        metainfo = await check_metainfo(context, update.effective_chat.id, metainfo)
+        if metainfo is not None:
+            items.append((metainfo, magnet))
+    if items:
+        await send_category_keyboard(context, update.effective_chat.id, items)
+
+
+async def check_metainfo(context, chat_id, metainfo):
+    """Return metainfo completed from the cache, or None if the torrent is already downloading"""
+    db: DB = context.bot_data["db"]
+    try:
+        # completed rows are kept after the torrent left the client, so only a pending one is a duplicate
+        row = await db.get_torrent_by_info_hash(metainfo.info_hash)
+        if row is not None and not row[2]:
+            await context.bot.send_message(
+                chat_id=chat_id, text=f'The torrent "{metainfo.name}" has already been added.'
+            )
+            return None
+        if metainfo.piece_length:
+            await db.save_metainfo(metainfo)
+        else:
+            # magnet links carry no metainfo, reuse the one of a torrent file seen before
+            metainfo = await db.get_metainfo(metainfo.info_hash) or metainfo
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+    return metainfo
+
+
+@profiled
+async def flush_media_group(context):
+    chat_id, _ = context.job.data
+    batch = context.bot_data["batches"].pop(context.job.data, None)
+    if batch is not None:
+        await send_category_keyboard(context, chat_id, batch["items"])
+
+
+async def send_category_keyboard(context, chat_id, items):
+    """Stage torrent files and magnet links and ask once for the category to add them to"""
+    keyboard = []
+    # the same torrent sent twice in one batch is added once
+    items = list({metainfo.info_hash: (metainfo, data) for metainfo, data in items}.values())
+    category = acl.get_categories(chat_id)
+    backends = get_client_configs(cfg)
+
+    # client and directory are resolved now, so a config reload cannot send the torrent elsewhere.
+    # Client names have no length limit, the callback data carries only the index of the choice
+    labels = []
+    choices = []
+    for backend in backends:
+        for client_path in backend.get("path") or []:
+            if category and client_path["category"] not in category:
+                continue
+            labels.append(
+                client_path["category"] if len(backends) == 1 else f"{backend['name']}: {client_path['category']}"
+            )
+            choices.append((backend["name"], client_path["dir"]))
+    token = get_uploads(context, chat_id).put((items, choices))
+    for index, label in enumerate(labels):
+        keyboard.append([InlineKeyboardButton(label, callback_data=f"download:{token}:{index}")])
+    keyboard.append([InlineKeyboardButton("Cancel", callback_data=f"download:cancel:{token}")])
+    if len(items) == 1:
+        text = f'Which Plex category do you want to use for the torrent "{describe_torrent(items[0][0])}"?'
+    else:
+        text = "\n".join(
+            [f"Which Plex category do you want to use for the {len(items)} downloaded torrents?"]
+            + [f"- {describe_torrent(metainfo)}" for metainfo, _ in items]
+        )[: tools.MESSAGE_MAX_LENGTH]
+    try:
+        await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=InlineKeyboardMarkup(keyboard))
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+
+
+def get_uploads(context, chat_id) -> TokenStore:
+    """Get the staged uploads of a chat, each chat has its own store so others cannot evict its uploads"""
+    return context.bot_data["uploads"].setdefault(chat_id, TokenStore(maxsize=UPLOAD_MAXSIZE, ttl=UPLOAD_TTL))
+
+
+def describe_torrent(metainfo):
+    if metainfo.size:
+        return f"{metainfo.name} ({tools.humanize_bytes(metainfo.size)})"
+    return metainfo.name
 
 
 @restricted
 async def download_torrent_logic(update, context):
     global client
-    callback_data = update.callback_query.data.replace("download:", "")
-    if callback_data == "cancel":
+    uploads = get_uploads(context, update.effective_chat.id)
+    callback_data = update.callback_query.data.split(":")[1:]
+    if callback_data[0] == "cancel":
+        uploads.pop(callback_data[1])
         await context.bot.delete_message(
             message_id=update.callback_query.message.message_id,
             chat_id=update.callback_query.message.chat.id,
         )
-    else:
-        try:
-            result = client.add_torrent(
-                torrent_data=b64decode(context.user_data["torrent_data"]),
-                download_dir=callback_data,
-            )
-        except Exception:
-            await error_action(update, context)
-            await context.bot.editMessageText(
-                message_id=update.callback_query.message.message_id,
-                chat_id=update.effective_chat.id,
-                text="Error adding torrent file. Try again later.",
-            )
-            return
+        return
 
-        if result:
-            await context.bot.editMessageText(
-                message_id=update.callback_query.message.message_id,
-                chat_id=update.effective_chat.id,
-                text=f'Torrent "*{result.name}*" added successfully',
-                parse_mode="Markdown",
-            )
-            try:
-                db = await DB.create(cfg["db"]["path"])
-            except Exception:
-                await error_action(update, context)
-            else:
-                try:
-                    await db.add_torrent(update.callback_query.message.chat.id, str(result.torrent_id))
-                except Exception:
-                    await error_action(update, context)
+    token, index = callback_data
+    upload = uploads.get(token)
+    if upload is None:
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.effective_chat.id,
+            text="This upload has expired. Send the torrent file again.",
+        )
+        return
+    # pop before the client call, so a second tap on the keyboard cannot add the torrents twice
+    uploads.pop(token)
+    items, choices = upload
 
-            logger.info(
-                f"User {update.effective_user.first_name} "
-                f"{update.effective_user.last_name} ({update.effective_user.username}) "
-                f"added a torrent file {result.name} to the torrent client download queue "
-                f"with the path {callback_data}"
+    try:
+        backend, download_dir = choices[int(index)]
+    except Exception:
+        await error_action(update, context)
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.effective_chat.id,
+            text="Error adding torrent file. Try again later.",
+        )
+        return
+
+    results = await asyncio.gather(
+        *(
+            client.add_torrent(
+                torrent_data=data, backend=backend, download_dir=download_dir, info_hash=metainfo.info_hash
             )
-        else:
+            for metainfo, data in items
+        ),
+        return_exceptions=True,
+    )
+    added = [result for result in results if not isinstance(result, BaseException)]
+    for (metainfo, _), result in zip(items, results, strict=True):
+        if isinstance(result, BaseException):
             logger.error(
-                f"An error occurred while adding a torrent file {result.name} "
-                f"to the torrent client queue with the path {callback_data} "
+                f"An error occurred while adding a torrent {metainfo.name} "
+                f"to the torrent client {backend} queue with the path {download_dir} "
                 f"by user {update.effective_user.first_name} "
-                f"{update.effective_user.last_name} ({update.effective_user.username})"
+                f"{update.effective_user.last_name} ({update.effective_user.username}): "
+                f"{type(result).__name__}({result})"
             )
-            await context.bot.editMessageText(
-                message_id=update.callback_query.message.message_id,
-                chat_id=update.effective_chat.id,
-                text="Error adding torrent file. Try again later.",
+        else:
+            logger.info(
+                f"User {update.effective_user.first_name} "
+                f"{update.effective_user.last_name} ({update.effective_user.username}) "
+                f"added a torrent {result.name} to the torrent client {backend} download queue "
+                f"with the path {download_dir}"
             )
 
+    if added:
+        db: DB = context.bot_data["db"]
+        try:
+            await db.add_torrents(
+                update.callback_query.message.chat.id,
+                [
+                    (str(result.torrent_id), metainfo.info_hash)
+                    for (metainfo, _), result in zip(items, results, strict=True)
+                    if not isinstance(result, BaseException)
+                ],
+            )
+        except Exception:
+            await error_action(update, context)
+        else:
+            if context.job_queue:
+                schedule_status_check(context.job_queue)
+
+    if len(items) == 1:
+        if added:
+            text = f'Torrent "*{escape_markdown(added[0].name)}*" added successfully'
+        else:
+            text = "Error adding torrent file. Try again later."
+    else:
+        lines = [f"Added {len(added)} of {len(items)} torrents:"]
+        for (metainfo, _), result in zip(items, results, strict=True):
+            if isinstance(result, BaseException):
+                lines.append(f"{emojize(':cross_mark:')} {escape_markdown(metainfo.name)} - failed")
+            else:
+                lines.append(f"{emojize(':check_mark_button:')} *{escape_markdown(result.name)}*")
+        text = "\n".join(lines)[: tools.MESSAGE_MAX_LENGTH]
+    await context.bot.editMessageText(
+        message_id=update.callback_query.message.message_id,
+        chat_id=update.effective_chat.id,
+        text=text,
+        parse_mode="Markdown",
+    )
+
 
 @restricted
-async def delete_torrent_action(update, context):
-    keyboard = []
-    torrents = await get_torrents(update, context)
+async def delete_torrent_action(update, context, query=None):
+    torrents = await get_torrents(update, context, fields=FIELDS_NAME)
+    if query:
+        needle = query.casefold()
+        torrents = [torrent for torrent in torrents if needle in torrent.name.casefold()]
     if len(torrents) > 0:
-        for torrent in torrents:
-            keyboard.append(
-                [
-                    InlineKeyboardButton(
-                        torrent.name,
-                        callback_data=f"delete:{torrent.torrent_id}",
-                    )
-                ]
-            )
-        keyboard.append([InlineKeyboardButton("Cancel", callback_data="delete:cancel")])
+        picker = {"query": query, "torrents": [(torrent.torrent_id, torrent.name) for torrent in torrents]}
+        token = context.bot_data["pickers"].put(picker)
+        text, keyboard = make_delete_picker(token, picker, 0)
         try:
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
-                text="Which torrent do you want to delete?",
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                text=text,
+                reply_markup=keyboard,
             )
         except Exception:
             await error_action(update, context)
+    elif query:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f'There are no torrents matching "{query}" that you can delete.',
+        )
     else:
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
@@ -220,68 +444,95 @@ async def delete_torrent_action(update, context):
         )
 
 
+@restricted
+async def delete_search_action(update, context):
+    if context.args:
+        await delete_torrent_action(update, context, query=" ".join(context.args))
+    else:
+        context.user_data["delete_search"] = True
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Send a part of the torrent name you want to delete.",
+        )
+
+
 @restricted
 async def delete_torrent_logic(update, context):  # noqa: C901
     global client
     callback_data: str = update.callback_query.data.replace("delete:", "")
+    await update.callback_query.answer()
     if callback_data == "cancel":
         await context.bot.delete_message(
             message_id=update.callback_query.message.message_id,
             chat_id=update.callback_query.message.chat.id,
         )
-    elif "confirm" in callback_data:
-        callback_data = callback_data.replace("confirm:", "")
+        return
+
+    if callback_data == "search":
+        context.user_data["delete_search"] = True
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.callback_query.message.chat.id,
+            text="Send a part of the torrent name you want to delete.",
+        )
+        return
+
+    action, token, value = callback_data.split(":")
+    picker = context.bot_data["pickers"].get(token)
+    if picker is None:
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.callback_query.message.chat.id,
+            text="This torrent list has expired. Request it again.",
+        )
+        return
+
+    if action == "page":
+        text, keyboard = make_delete_picker(token, picker, int(value))
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.callback_query.message.chat.id,
+            text=text,
+            reply_markup=keyboard,
+        )
+        return
+
+    torrent_id, torrent_name = picker["torrents"][int(value)]
+    if action == "pick":
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.callback_query.message.chat.id,
+            text=f'Do you realy want to delete torrent "*{escape_markdown(torrent_name)}*"',
+            reply_markup=make_delete_confirm_keyboard(token, value),
+            parse_mode="Markdown",
+        )
+    elif action == "confirm":
+        db: DB = context.bot_data["db"]
         try:
-            db = await DB.create(cfg["db"]["path"])
+            await client.remove_torrent(torrent_id=torrent_id)
         except Exception:
             await error_action(update, context)
+            await context.bot.editMessageText(
+                message_id=update.callback_query.message.message_id,
+                chat_id=update.effective_chat.id,
+                text=f"An error occurred while deleting the torrent {torrent_name}. Try again later.",
+            )
         else:
-            torrent_name = ""
             try:
-                torrent = client.get_torrent(callback_data)
-                if torrent is not None:
-                    torrent_name = torrent.name
-                client.remove_torrent(torrent_id=callback_data)
+                await db.remove_torrent_by_id(torrent_id)
             except Exception:
                 await error_action(update, context)
-                if torrent_name != "":
-                    await context.bot.editMessageText(
-                        message_id=update.callback_query.message.message_id,
-                        chat_id=update.effective_chat.id,
-                        text=f"An error occurred while deleting the torrent {torrent_name}. Try again later.",
-                    )
-            else:
-                try:
-                    await db.remove_torrent_by_id(callback_data)
-                except Exception:
-                    await error_action(update, context)
-                await context.bot.editMessageText(
-                    message_id=update.callback_query.message.message_id,
-                    chat_id=update.effective_chat.id,
-                    text=f'Torrent "*{torrent_name}*" was successfully deleted',
-                    parse_mode="Markdown",
-                )
-                logger.info(
-                    f"Torrent {torrent_name} was successfully deleted by user "
-                    f"{update.effective_user.first_name} {update.effective_user.last_name} "
-                    f"({update.effective_user.username})"
-                )
-    else:
-        try:
-            torrent_name = ""
-            torrent = client.get_torrent(callback_data)
-            if torrent is not None:
-                torrent_name = torrent.name
-        except Exception:
-            await error_action(update, context)
-        else:
             await context.bot.editMessageText(
                 message_id=update.callback_query.message.message_id,
-                chat_id=update.callback_query.message.chat.id,
-                text=f'Do you realy want to delete torrent "*{torrent_name}*"',
-                reply_markup=make_delete_confirm_keyboard(callback_data),
+                chat_id=update.effective_chat.id,
+                text=f'Torrent "*{escape_markdown(torrent_name)}*" was successfully deleted',
                 parse_mode="Markdown",
             )
+            logger.info(
+                f"Torrent {torrent_name} was successfully deleted by user "
+                f"{update.effective_user.first_name} {update.effective_user.last_name} "
+                f"({update.effective_user.username})"
+            )
 
 
 @restricted
@@ -296,66 +547,149 @@ async def list_torrent_action(update, context, **kwargs):
         torrents = await get_torrents(update, context, **kwargs)
 
     if len(torrents) > 0:
+        pages = tools.paginate(
+            [make_torrent_info(torrent) for torrent in torrents],
+            page_size=get_page_size(cfg),
+        )
+        token = context.bot_data["lists"].put(pages)
         try:
-            for torrent in torrents:
-                if torrent.done_date is None or torrent.done_date == datetime.fromtimestamp(0, ZoneInfo("UTC")).replace(
-                    tzinfo=None
-                ):
-                    try:
-                        eta = str(torrent.eta)
-                    except ValueError:
-                        eta = "unknown"
-                    torrent_info = dedent(
-                        f"""
-                        *{torrent.name}*
-                        Status: {torrent.status}
-                        Procent: {round(torrent.progress, 2)}%
-                        Speed: {tools.humanize_bytes(torrent.download_speed)}/s
-                        ETA: {eta}
-                        Peers: {torrent.num_seeds_download}
-                        """
-                    )
-                else:
-                    torrent_info = dedent(
-                        f"""
-                        *{torrent.name}*
-                        Status: {torrent.status}
-                        Speed: {tools.humanize_bytes(torrent.upload_speed)}/s
-                        Peers: {torrent.num_seeds_upload}
-                        Ratio: {round(torrent.ratio, 2)}
-                        """
-                    )
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=torrent_info,
-                    parse_mode="Markdown",
-                )
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=make_page_text(pages, 0),
+                reply_markup=make_page_keyboard("list", token, 0, len(pages)),
+                parse_mode="Markdown",
+            )
         except Exception:
             await error_action(update, context)
     else:
         await context.bot.send_message(chat_id=update.effective_chat.id, text="The torrent list is empty")
 
 
-def make_main_keyboard():
-    custom_keyboard = [
-        [f"{emojize(':arrow_down:', language='alias')}List Downloading"],
-        [f"{emojize(':page_facing_up:', language='alias')}List All"],
-        [f"{emojize(':cross_mark:', language='alias')}Delete"],
+@restricted
+async def list_torrent_page_logic(update, context):
+    _, token, page = update.callback_query.data.split(":")
+    pages = context.bot_data["lists"].get(token)
+    await update.callback_query.answer()
+    if pages is None:
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.callback_query.message.chat.id,
+            text="This torrent list has expired. Request it again.",
+        )
+        return
+
+    page = min(max(int(page), 0), len(pages) - 1)
+    try:
+        await context.bot.editMessageText(
+            message_id=update.callback_query.message.message_id,
+            chat_id=update.callback_query.message.chat.id,
+            text=make_page_text(pages, page),
+            reply_markup=make_page_keyboard("list", token, page, len(pages)),
+            parse_mode="Markdown",
+        )
+    except Exception:
+        await error_action(update, context)
+
+
+def make_torrent_info(torrent):
+    name = escape_markdown(torrent.name)
+    if not torrent.done:
+        eta = str(torrent.eta) if torrent.eta is not None else "unknown"
+        return dedent(
+            f"""
+            *{name}*
+            Status: {torrent.status}
+            Procent: {round(torrent.progress, 2)}%
+            Speed: {tools.humanize_bytes(torrent.download_speed)}/s
+            ETA: {eta}
+            Peers: {torrent.num_seeds_download}
+            """
+        )
+    return dedent(
+        f"""
+        *{name}*
+        Status: {torrent.status}
+        Speed: {tools.humanize_bytes(torrent.upload_speed)}/s
+        Peers: {torrent.num_seeds_upload}
+        Ratio: {round(torrent.ratio, 2)}
+        """
+    )
+
+
+def make_page_text(pages, page):
+    if len(pages) == 1:
+        return pages[page]
+    return f"Page {page + 1}/{len(pages)}\n{pages[page]}"
+
+
+def make_page_buttons(prefix, token, page, pages):
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("« Prev", callback_data=f"{prefix}:{token}:{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("Next »", callback_data=f"{prefix}:{token}:{page + 1}"))
+    return buttons
+
+
+def make_page_keyboard(prefix, token, page, pages):
+    buttons = make_page_buttons(prefix, token, page, pages)
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup([buttons])
+
+
+def get_main_keyboard_buttons():
+    return [
+        f"{emojize(':arrow_down:', language='alias')}List Downloading",
+        f"{emojize(':page_facing_up:', language='alias')}List All",
+        f"{emojize(':cross_mark:', language='alias')}Delete",
     ]
+
+
+def make_main_keyboard():
+    custom_keyboard = [[button] for button in get_main_keyboard_buttons()]
     make_markup = ReplyKeyboardMarkup(custom_keyboard, resize_keyboard=True)
     return make_markup
 
 
-def make_delete_confirm_keyboard(torrent_id):
+def make_delete_confirm_keyboard(token, index):
     keyboard_array = InlineKeyboardMarkup(
         [
-            [InlineKeyboardButton("Confirm", callback_data=f"delete:confirm:{torrent_id}")],
+            [InlineKeyboardButton("Confirm", callback_data=f"delete:confirm:{token}:{index}")],
             [InlineKeyboardButton("Cancel", callback_data="delete:cancel")],
         ]
     )
     return keyboard_array
 
 
+def make_delete_picker(token, picker, page):
+    page_size = get_page_size(cfg)
+    pages = max((len(picker["torrents"]) + page_size - 1) // page_size, 1)
+    page = min(max(page, 0), pages - 1)
+    start = page * page_size
+
+    keyboard = [
+        [InlineKeyboardButton(name[:DELETE_BUTTON_LENGTH], callback_data=f"delete:pick:{token}:{index}")]
+        for index, (_, name) in enumerate(picker["torrents"][start : start + page_size], start=start)
+    ]
+    navigation = make_page_buttons("delete:page", token, page, pages)
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append(
+        [
+            InlineKeyboardButton(f"{emojize(':magnifying_glass_tilted_left:')}Search", callback_data="delete:search"),
+            InlineKeyboardButton("Cancel", callback_data="delete:cancel"),
+        ]
+    )
+
+    text = "Which torrent do you want to delete?"
+    if picker["query"]:
+        text += f' Matching "{picker["query"]}".'
+    if pages > 1:
+        text += f" Page {page + 1}/{pages}"
+    return text, InlineKeyboardMarkup(keyboard)
+
+
 @restricted
 async def start_action(update, context):
     await context.bot.send_message(
@@ -373,6 +707,7 @@ async def help_action(update, context):
     {emojize(":arrow_down:", language="alias")}List Downloading - List download queue
     {emojize(":page_facing_up:", language="alias")}List All - List all torrent in the torrent client
     {emojize(":cross_mark:", language="alias")}Delete - Complete delete torrent from torrent client and filesystem
+    /delete <name> - Search torrents to delete by a part of the name
     """
     )
     await context.bot.send_message(chat_id=update.effective_chat.id, text=help_text)
@@ -409,85 +744,489 @@ async def error_action(update, context):
         logger.error(text)
 
 
+@profiled
+async def status_check_job(context):
+    """Check download status and schedule the next check from its result"""
+    if status_lock.locked():
+        STATUS_CHECK_OVERLAPS.inc()
+    # an exception must not end the chain of status checks, the next one runs after the default period
+    delay = DEFAULT_CHECK_PERIOD
+    try:
+        async with status_lock:
+            with STATUS_CHECK_SECONDS.time():
+                delay = await check_torrent_download_status(context)
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+    schedule_status_check(context.job_queue, delay)
+
+
 async def check_torrent_download_status(context):  # noqa: C901
+    """Notify about downloaded torrents and return seconds until the next check is worth doing"""
     global client
-    global db
-
-    if isinstance(db, Coroutine):
-        db = await db
+    db: DB = context.bot_data["db"]
+    check_period, min_check_period, idle_check_period = get_schedule(cfg, "events" in context.bot_data)
 
     try:
         torrents = await db.list_uncomplete_torrents()
     except Exception as exc:
         logger.error(f"{type(exc).__name__}({exc})")
+        return check_period
+
+    if not torrents:
+        return idle_check_period
+
+    unavailable = set()
+    try:
+        tasks = {
+            task.torrent_id: task
+            for task in await client.get_torrents_by_ids(
+                (torrent[1] for torrent in torrents), fields=FIELDS_STATUS, unavailable=unavailable
+            )
+        }
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+        return check_period
+
+    delay = check_period
+    for torrent in torrents:
+        if torrent[1] in unavailable:
+            continue
+        task = tasks.get(torrent[1])
+        if task is None:
+            try:
+                await db.remove_torrent_by_id(torrent[1])
+            except Exception as exc:
+                logger.error(f"{type(exc).__name__}({exc})")
+            continue
+
+        if not task.done:
+            if task.eta_seconds >= 0:
+                delay = min(delay, max(task.eta_seconds, min_check_period))
+            continue
+
+        await complete_and_notify(context.bot_data, torrent[0], torrent[1], task.name)
+    return delay
+
+
+async def complete_and_notify(bot_data, uid, torrent_id, name):
+    """Mark torrent complete and notify its chats, return False if it was completed before"""
+    try:
+        if not await bot_data["db"].complete_torrent(torrent_id):
+            return False
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+        return False
+
+    response = f'Torrent "*{escape_markdown(name)}*" was successfully downloaded'
+    try:
+        await bot_data["outbox"].send(list(acl.get_notify_chats(uid)), response)
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+    return True
+
+
+async def find_event_torrent(db, event):
+    """Find the bot database row of the torrent a completion event reports, None if the bot did not add it"""
+    if event.info_hash is not None:
+        row = await db.get_torrent_by_info_hash(event.info_hash)
+        if row is not None:
+            return row
+
+    names = [event.client] if event.client is not None else list(client.clients)
+    for client_id in filter(None, (event.torrent_id, event.info_hash)):
+        # qBittorrent torrent ids are info hashes, torrents added before the info hash was stored have no prefix
+        candidates = [f"{name}:{client_id}" for name in names]
+        if client.split(client_id)[0] in names:
+            candidates.append(client_id)
+        for torrent_id in candidates:
+            row = await db.get_torrent_by_id(torrent_id)
+            if row is not None:
+                return row
+    return None
+
+
+@profiled
+async def handle_completion(application, event):
+    """Complete and notify the torrent of a completion event right away, after the client confirms it is done"""
+    try:
+        row = await find_event_torrent(application.bot_data["db"], event)
+        if row is None or row[2]:
+            COMPLETION_EVENTS.inc(result="unknown" if row is None else "duplicate")
+            return
+        # ask the backend directly, the status snapshot may predate the completion
+        task = await client.fetch_torrent(row[1], fields=FIELDS_STATUS)
+    except Exception as exc:
+        COMPLETION_EVENTS.inc(result="error")
+        logger.error(f"{type(exc).__name__}({exc})")
+        return
+
+    if task is None or not task.done:
+        # the status check reconciles it later
+        COMPLETION_EVENTS.inc(result="not_done")
+        return
+    completed = await complete_and_notify(application.bot_data, row[0], row[1], task.name)
+    COMPLETION_EVENTS.inc(result="completed" if completed else "duplicate")
+
+
+@profiled
+async def db_maintenance(context):
+    db: DB = context.bot_data["db"]
+    retention = int(cfg["db"].get("retention", 0))
+
+    try:
+        if retention > 0:
+            removed = await db.prune_completed_torrents(retention * 86400)
+            if removed:
+                logger.info(f"Removed {removed} completed torrents older than {retention} days from the database")
+        await db.prune_metainfo(METAINFO_RETENTION)
+        await db.maintenance()
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+
+
+def make_client(config):
+    """Construct torrent client backend from the client config section, wrapped in the snapshot cache"""
+    if config["type"] == "transmission":
+        backend = Transmission(
+            address=config["address"],
+            port=config["port"],
+            user=config["user"],
+            password=config["password"],
+            workers=int(config.get("workers", DEFAULT_WORKERS)),
+            name=config["name"],
+        )
     else:
-        if torrents:
-            for torrent in torrents:
-                try:
-                    task = client.get_torrent(torrent[1])
-                except Exception:
-                    await db.remove_torrent_by_id(torrent[1])
-                else:
-                    try:
-                        if (
-                            task is not None
-                            and task.done_date is not None
-                            and task.done_date != datetime.fromtimestamp(0, ZoneInfo("UTC")).replace(tzinfo=None)
-                        ):
-                            await db.complete_torrent(torrent[1])
-                    except Exception as exc:
-                        logger.error(f"{type(exc).__name__}({exc})")
-                    else:
-                        if (
-                            task is not None
-                            and task.done_date is not None
-                            and task.done_date != datetime.fromtimestamp(0, ZoneInfo("UTC")).replace(tzinfo=None)
-                        ):
-                            response = f'Torrent "*{task.name}*" was successfully downloaded'
-                            try:
-                                notify_flag = False
-                                try:
-                                    chat = cfg["telegram"]["allow_chat"].get(torrent[0])
-                                except Exception:
-                                    notify_flag = False
-                                else:
-                                    if chat["notify"] == "personal":
-                                        notify_flag = True
-                                    if notify_flag:
-                                        context.bot.send_message(
-                                            chat_id=torrent[0],
-                                            text=response,
-                                            parse_mode="Markdown",
-                                        )
-
-                                notify_about_all = [
-                                    chat["telegram_id"]
-                                    for chat in cfg["telegram"]["allow_chat"]
-                                    if chat["notify"] == "all"
-                                ]
-                                if notify_about_all:
-                                    for telegram_id in notify_about_all:
-                                        await context.bot.send_message(
-                                            chat_id=telegram_id,
-                                            text=response,
-                                            parse_mode="Markdown",
-                                        )
-                            except Exception as exc:
-                                logger.error(f"{type(exc).__name__}({exc})")
+        backend = Qbittorrent(
+            address=config["address"],
+            port=config["port"],
+            user=config["user"],
+            password=config["password"],
+            workers=int(config.get("workers", DEFAULT_WORKERS)),
+            name=config["name"],
+        )
+    return TorrentCache(backend, ttl=float(config.get("cache_ttl", DEFAULT_TTL)))
+
+
+def get_connection_settings(config):
+    """Get torrent client sections by name without the category paths, which need no reconnect"""
+    return {
+        section["name"]: {k: v for k, v in section.items() if k != "path"} for section in get_client_configs(config)
+    }
+
+
+def make_clients(config, current=None, current_config=None):
+    """Construct the torrent client registry, reusing clients of current whose connection settings did not change"""
+    reuse = get_connection_settings(current_config) if current is not None and current_config is not None else {}
+    clients = {}
+    timeouts = {}
+    try:
+        for name, section in get_connection_settings(config).items():
+            if current is not None and reuse.get(name) == section:
+                clients[name] = current.clients[name]
+            else:
+                clients[name] = make_client(section)
+            timeouts[name] = float(section.get("timeout", DEFAULT_CLIENT_TIMEOUT))
+    except Exception:
+        for name, torrent_client in clients.items():
+            if current is None or current.clients.get(name) is not torrent_client:
+                torrent_client.close()
+        raise
+    return ClientRegistry(clients, timeouts=timeouts)
+
+
+def get_schedule(config, events_running=False):
+    """Get longest, shortest and idle status check periods from the schedule config section"""
+    schedule = config.get("schedule") or {}
+    check_period = int(schedule.get("check_period", DEFAULT_CHECK_PERIOD))
+    min_check_period = int(schedule.get("min_check_period", DEFAULT_MIN_CHECK_PERIOD))
+    idle_check_period = int(schedule.get("idle_check_period", DEFAULT_IDLE_CHECK_PERIOD))
+    if events_running and get_events_settings(config) is not None:
+        # completions are pushed, a slow sweep catches events the bot missed while it was down
+        reconcile_period = int(config["events"].get("reconcile_period", DEFAULT_RECONCILE_PERIOD))
+        return reconcile_period, reconcile_period, max(idle_check_period, reconcile_period)
+    return check_period, min_check_period, idle_check_period
+
+
+def get_page_size(config):
+    return int(config["telegram"].get("page_size", DEFAULT_PAGE_SIZE))
+
+
+def get_maintenance_period(config):
+    return int(config["db"].get("maintenance_period", DEFAULT_DB_MAINTENANCE_PERIOD))
+
+
+def get_config_check_period(config):
+    return int((config.get("schedule") or {}).get("config_check_period", DEFAULT_CONFIG_CHECK_PERIOD))
+
+
+def check_settings(config):
+    """Derive every setting read at runtime from config, raising ValueError if one of them is invalid"""
+    if min(get_schedule(config) + get_schedule(config, events_running=True)) <= 0:
+        raise ConfigError("schedule check periods must be positive")
+    if get_page_size(config) <= 0:
+        raise ConfigError("telegram.page_size must be positive")
+    if get_maintenance_period(config) <= 0:
+        raise ConfigError("db.maintenance_period must be positive")
+    if int(config["db"].get("retention", 0)) < 0:
+        raise ConfigError("db.retention must not be negative")
+    if get_config_check_period(config) < 0:
+        raise ConfigError("schedule.config_check_period must not be negative")
+    outbox_settings = get_outbox_settings(config)
+    if outbox_settings["rate"] <= 0 or outbox_settings["chat_rate"] <= 0 or outbox_settings["digest_window"] < 0:
+        raise ConfigError("telegram send rates must be positive and digest_window must not be negative")
+
+
+def get_outbox_settings(config):
+    return {
+        "rate": float(config["telegram"].get("send_rate", DEFAULT_SEND_RATE)),
+        "chat_rate": float(config["telegram"].get("chat_send_rate", DEFAULT_CHAT_SEND_RATE)),
+        "digest_window": float(config["telegram"].get("digest_window", DEFAULT_DIGEST_WINDOW)),
+    }
+
+
+def schedule_status_check(job_queue, delay=STATUS_WAKE_DELAY):
+    """Schedule the next download status check in delay seconds unless one is already due earlier"""
+    due = datetime.datetime.now(datetime.UTC) + datetime.timedelta(seconds=delay)
+    pending = [job for job in job_queue.get_jobs_by_name(STATUS_CHECK_JOB) if job.next_t is not None]
+    if pending and min(job.next_t for job in pending) <= due:
+        return
+    for job in pending:
+        job.schedule_removal()
+    job_queue.run_once(status_check_job, when=delay, name=STATUS_CHECK_JOB)
+
+
+def schedule_db_maintenance(job_queue, first=60):
+    """(Re)schedule the database maintenance job with the current db config"""
+    for job in job_queue.get_jobs_by_name(DB_MAINTENANCE_JOB):
+        job.schedule_removal()
+    job_queue.run_repeating(
+        db_maintenance,
+        interval=get_maintenance_period(cfg),
+        first=first,
+        name=DB_MAINTENANCE_JOB,
+    )
+
+
+def schedule_config_watch(job_queue):
+    """(Re)schedule the config file check job with the current schedule config, 0 leaves reloads to SIGHUP"""
+    for job in job_queue.get_jobs_by_name(CONFIG_WATCH_JOB):
+        job.schedule_removal()
+    config_check_period = get_config_check_period(cfg)
+    if config_check_period > 0:
+        job_queue.run_repeating(
+            watch_config, interval=config_check_period, first=config_check_period, name=CONFIG_WATCH_JOB
+        )
+
+
+def get_metrics_settings(config):
+    """Get metrics listener address and port, None when the metrics section has no port"""
+    section = config.get("metrics") or {}
+    if not section.get("port"):
+        return None
+    return section.get("address", metrics.DEFAULT_ADDRESS), int(section["port"])
+
+
+def get_events_settings(config):
+    """Get completion event listener address, port and unix socket, None when the events section has neither"""
+    section = config.get("events") or {}
+    if not section.get("port") and not section.get("unix"):
+        return None
+    return section.get("address", events.DEFAULT_ADDRESS), int(section.get("port") or 0), section.get("unix")
+
+
+def get_webhook_settings(config):
+    """Get run_webhook arguments, None when the bot falls back to polling for updates"""
+    webhook = get_webhook_config(config)
+    if webhook is None:
+        return None
+    settings = {
+        "webhook_url": webhook["url"],
+        "url_path": webhook["path"],
+        "secret_token": webhook["secret_token"],
+        "max_connections": webhook["max_connections"],
+        "cert": webhook["cert"],
+        "key": webhook["key"],
+    }
+    if webhook["unix"]:
+        settings["unix"] = webhook["unix"]
+    else:
+        settings.update(listen=webhook["listen"], port=webhook["port"])
+    return settings
+
+
+def instrument_handlers(application):
+    """Observe the duration of every registered update handler callback and profile it in profile mode"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            name = handler.callback.__name__
+            handler.callback = metrics.timed(HANDLER_SECONDS, HANDLER_ERRORS, handler=name)(profiled(handler.callback))
+
+
+async def profile_report(context):
+    if profiler is not None:
+        profiler.report()
+
+
+async def reload_config(application):
+    """Re-read the config file and swap it in, keeping the current config if the new one is invalid"""
+    global acl
+    global cfg
+    global client
+
+    async with config_lock:
+        try:
+            new_cfg = tools.get_config(application.bot_data["config_path"])
+            check_config(new_cfg)
+            check_settings(new_cfg)
+            new_acl = Acl.from_config(new_cfg)
+        except Exception as exc:
+            logger.error(f"Config reload error, keeping the current configuration: {exc}")
+            return
+
+        old_cfg = cfg
+        new_client = None
+        if get_connection_settings(new_cfg) != get_connection_settings(old_cfg):
+            try:
+                new_client = await asyncio.to_thread(make_clients, new_cfg, client, old_cfg)
+            except Exception as exc:
+                logger.error(f"Torrent client connection error, keeping the current configuration: {exc}")
+                return
+
+        for section, key in RESTART_SETTINGS:
+            if (old_cfg.get(section) or {}).get(key) != (new_cfg.get(section) or {}).get(key):
+                logger.warning(f"Changing {section}.{key} requires a restart of the bot")
+
+        cfg, acl = new_cfg, new_acl
+        if new_client is not None:
+            old_client, client = client, new_client
+            for name, torrent_client in old_client.clients.items():
+                if new_client.clients.get(name) is not torrent_client:
+                    torrent_client.close()
+            logger.info("Torrent clients were reconnected with the new configuration")
+
+        if application.job_queue:
+            events_running = "events" in application.bot_data
+            if get_schedule(new_cfg, events_running) != get_schedule(old_cfg, events_running):
+                schedule_status_check(application.job_queue, min(get_schedule(new_cfg, events_running)))
+            if get_maintenance_period(new_cfg) != get_maintenance_period(old_cfg):
+                schedule_db_maintenance(application.job_queue)
+            if get_config_check_period(new_cfg) != get_config_check_period(old_cfg):
+                schedule_config_watch(application.job_queue)
+        outbox = application.bot_data.get("outbox")
+        if outbox is not None:
+            outbox.configure(**get_outbox_settings(new_cfg))
+        logger.info("Configuration was reloaded")
+
+
+@profiled
+async def watch_config(context):
+    """Reload the config file when its modification time changes"""
+    try:
+        mtime = Path(context.bot_data["config_path"]).stat().st_mtime_ns
+    except OSError as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+        return
+    if mtime != context.bot_data.get("config_mtime"):
+        context.bot_data["config_mtime"] = mtime
+        await reload_config(context.application)
+
+
+async def on_startup(application):
+    if profiler is not None:
+        profiler.start()
+    application.bot_data["lists"] = TokenStore()
+    application.bot_data["pickers"] = TokenStore()
+    application.bot_data["uploads"] = {}
+    application.bot_data["batches"] = {}
+    try:
+        application.bot_data["db"] = await DB.create(
+            cfg["db"]["path"], readers=int(cfg["db"].get("readers", DEFAULT_DB_READERS))
+        )
+    except Exception as exc:
+        logger.error(f"{type(exc).__name__}({exc})")
+        raise
+
+    application.bot_data["outbox"] = Outbox(application.bot, application.bot_data["db"], **get_outbox_settings(cfg))
+    application.bot_data["outbox"].start()
+
+    metrics_settings = get_metrics_settings(cfg)
+    if metrics_settings is not None:
+        metrics_server = metrics.MetricsServer()
+        try:
+            await metrics_server.start(*metrics_settings)
+        except OSError as exc:
+            logger.error(f"Metrics endpoint error: {type(exc).__name__}({exc})")
+        else:
+            application.bot_data["metrics"] = metrics_server
+            logger.info(f"Serving metrics on {metrics_settings[0]}:{metrics_settings[1]}")
+
+    events_settings = get_events_settings(cfg)
+    if events_settings is not None:
+        event_server = events.EventServer(lambda event: handle_completion(application, event))
+        try:
+            await event_server.start(*events_settings)
+        except OSError as exc:
+            logger.error(f"Completion event endpoint error: {type(exc).__name__}({exc})")
+        else:
+            application.bot_data["events"] = event_server
+            address, port, unix = events_settings
+            logger.info(f"Accepting completion events on {unix or f'{address}:{port}'}")
+
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP, lambda: application.create_task(reload_config(application))
+        )
+
+
+async def on_shutdown(application):
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    metrics_server = application.bot_data.pop("metrics", None)
+    if metrics_server is not None:
+        await metrics_server.stop()
+    event_server = application.bot_data.pop("events", None)
+    if event_server is not None:
+        await event_server.stop()
+    outbox = application.bot_data.pop("outbox", None)
+    if outbox is not None:
+        await outbox.stop()
+    db = application.bot_data.pop("db", None)
+    if db is not None:
+        try:
+            await db.close()
+        except Exception as exc:
+            logger.error(f"{type(exc).__name__}({exc})")
+    client.close()
+    if profiler is not None:
+        profiler.stop()
 
 
 def main():
+    global acl
     global cfg
     global client
-    global db
     global logger
+    global profiler
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config", required=True, help="configuration file")
     parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--profile", action="store_true", help="profile handlers and jobs, track memory growth")
+    parser.add_argument("--profile-dir", default=DEFAULT_PROFILE_DIR, help="directory for pstats and folded profiles")
+    parser.add_argument(
+        "--profile-period", type=int, default=DEFAULT_PROFILE_PERIOD, help="seconds between profile dumps"
+    )
+    parser.add_argument(
+        "--slow-threshold",
+        type=float,
+        default=DEFAULT_SLOW_THRESHOLD,
+        help="log handlers and jobs running longer than this many seconds",
+    )
     args = parser.parse_args()
 
     logger = tools.init_log(debug=args.debug)
+    if args.profile:
+        profiler = Profiler(args.profile_dir, slow_threshold=args.slow_threshold)
 
     if not Path(args.config).is_file():
         logger.error(f"Torrent telegram bot configuration file {args.config} not found")
@@ -497,6 +1236,9 @@ def main():
 
     try:
         cfg = tools.get_config(args.config)
+        check_config(cfg)
+        check_settings(cfg)
+        acl = Acl.from_config(cfg)
     except Exception as exc:
         logger.error(f"Config file error: {exc}")
         sys.exit(1)
@@ -510,41 +1252,33 @@ def main():
         )
 
     try:
-        if cfg["client"]["type"] == "transmission":
-            client = Transmission(
-                address=cfg["client"]["address"],
-                port=cfg["client"]["port"],
-                user=cfg["client"]["user"],
-                password=cfg["client"]["password"],
-            )
-        else:
-            client = Qbittorrent(
-                address=cfg["client"]["address"],
-                port=cfg["client"]["port"],
-                user=cfg["client"]["user"],
-                password=cfg["client"]["password"],
-            )
+        client = make_clients(cfg)
     except Exception as exc:
         logger.error(f"Torrent client connection error: {exc}")
         sys.exit(1)
 
-    try:
-        db = DB.create(cfg["db"]["path"])
-    except Exception as exc:
-        logger.error(f"{type(exc).__name__}({exc})")
-        sys.exit(1)
-
-    application = ApplicationBuilder().token(cfg["telegram"]["token"])
+    application = ApplicationBuilder().token(cfg["telegram"]["token"]).post_init(on_startup).post_shutdown(on_shutdown)
 
     if "proxy" in cfg["telegram"]:
         request_instance = request.HTTPXRequest(proxy=cfg["telegram"]["proxy"]["url"])
         application.request(request_instance).get_updates_request(request_instance)
 
+    if "base_url" in cfg["telegram"]:
+        # self-hosted or fake Bot API server
+        base_url = cfg["telegram"]["base_url"].rstrip("/")
+        application.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+
+    webhook_settings = get_webhook_settings(cfg)
+    if webhook_settings is not None:
+        # telegram pushes up to max_connections updates in parallel, handle as many at once
+        application.concurrent_updates(webhook_settings["max_connections"])
+
     application = application.build()
     job_queue = application.job_queue
 
     start_handler = CommandHandler("start", start_action)
     help_handler = CommandHandler("help", help_action)
+    delete_search_handler = CommandHandler("delete", delete_search_action)
     download_torrent_handler = MessageHandler(
         filters.Document.MimeType("application/x-bittorrent"), download_torrent_action
     )
@@ -554,73 +1288,34 @@ def main():
     text_message_handler = MessageHandler(filters.TEXT, text_message_action)
     unknown_command_handler = MessageHandler(filters.COMMAND, unknown_command_action)
 
-    application.add_handler(CallbackQueryHandler(callback=download_torrent_logic, pattern=".*download.*"))
-    application.add_handler(CallbackQueryHandler(callback=delete_torrent_logic, pattern=".*delete.*"))
+    application.add_handler(CallbackQueryHandler(callback=download_torrent_logic, pattern="^download:"))
+    application.add_handler(CallbackQueryHandler(callback=delete_torrent_logic, pattern="^delete:"))
+    application.add_handler(CallbackQueryHandler(callback=list_torrent_page_logic, pattern="^list:"))
     application.add_handler(start_handler)
     application.add_handler(help_handler)
+    application.add_handler(delete_search_handler)
     application.add_handler(download_torrent_handler)
     application.add_handler(text_message_handler)
     application.add_handler(unknown_command_handler)
     application.add_handler(unknown_doctype_handler)
     application.add_error_handler(error_action)
+    instrument_handlers(application)
 
-    if "schedule" in cfg:
-        if "check_period" in cfg["schedule"]:
-            check_period = int(cfg["schedule"]["check_period"])
-        else:
-            check_period = 60
-        if "max_instances" in cfg["schedule"]:
-            max_instances = int(cfg["schedule"]["max_instances"])
-        else:
-            max_instances = 1
-    else:
-        check_period = 60
-        max_instances = 1
-
+    application.bot_data["config_path"] = args.config
+    application.bot_data["config_mtime"] = Path(args.config).stat().st_mtime_ns
     if job_queue:
-        job_queue.run_repeating(
-            check_torrent_download_status,
-            interval=check_period,
-            first=10,
-            job_kwargs={"max_instances": max_instances},
-        )
-    application.run_polling()
-    db.close()
+        schedule_status_check(job_queue, STATUS_FIRST_DELAY)
+        schedule_db_maintenance(job_queue)
+        schedule_config_watch(job_queue)
+        if profiler is not None:
+            job_queue.run_repeating(profile_report, interval=args.profile_period, first=args.profile_period)
+
+    if webhook_settings is None:
+        application.run_polling()
+    else:
+        logger.info(f"Receiving updates through webhook {webhook_settings['webhook_url']}")
+        application.run_webhook(**webhook_settings)
 
 
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
-if __name__ == "__main__":
-    main()
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+import asyncio
+from collections.abc import Iterable
+from time import monotonic
+
+from torrent_telegram_bot.custom_types import FIELDS_ALL, Torrent
+from torrent_telegram_bot.qbittorrent import Qbittorrent
+from torrent_telegram_bot.transmission import Transmission
+
+DEFAULT_TTL = 5.0
+
+
+class TorrentCache:
+    """Short-lived torrent list snapshot shared by every caller of the torrent client.
+
+    Concurrent callers wait for the same in-flight fetch, the snapshot is reused for ttl seconds
+    and is dropped as soon as a torrent is added or removed through the cache.
+    """
+
+    def __init__(self, client: Transmission | Qbittorrent, ttl: float = DEFAULT_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.snapshot: dict[str, Torrent] | None = None
+        self.snapshot_fields: frozenset[str] = frozenset()
+        self.fetched_at = 0.0
+        self.generation = 0
+        self.inflight: asyncio.Future[dict[str, Torrent]] | None = None
+        self.inflight_fields: frozenset[str] = frozenset()
+
+    async def get_snapshot(self, fields: Iterable[str] = FIELDS_ALL) -> dict[str, Torrent]:
+        """Get torrents indexed by torrent id, fetching them from the client only when the snapshot is stale.
+
+        A fresh snapshot with more fields than needed is reused, a new fetch asks only for the caller's fields.
+        """
+        fields = frozenset(fields)
+        while True:
+            if (
+                self.snapshot is not None
+                and fields <= self.snapshot_fields
+                and monotonic() - self.fetched_at < self.ttl
+            ):
+                return self.snapshot
+            if self.inflight is None:
+                self.inflight_fields = fields
+                self.inflight = asyncio.ensure_future(self.__fetch(self.generation, fields))
+            elif not fields <= self.inflight_fields:
+                await asyncio.shield(self.inflight)
+                continue
+            return await asyncio.shield(self.inflight)
+
+    async def __fetch(self, generation: int, fields: frozenset[str]) -> dict[str, Torrent]:
+        try:
+            snapshot = {torrent.torrent_id: torrent for torrent in await self.client.get_torrents(fields)}
+        finally:
+            if generation == self.generation:
+                self.inflight = None
+        if generation == self.generation:
+            self.snapshot = snapshot
+            self.snapshot_fields = fields
+            self.fetched_at = monotonic()
+        return snapshot
+
+    def invalidate(self) -> None:
+        """Drop the snapshot so the next caller fetches fresh torrent state"""
+        self.generation += 1
+        self.snapshot = None
+        self.inflight = None
+
+    async def get_torrents(self, fields: Iterable[str] = FIELDS_ALL) -> list[Torrent]:
+        """Get all torrents from snapshot"""
+        return list((await self.get_snapshot(fields)).values())
+
+    async def get_torrents_by_ids(
+        self, torrent_ids: Iterable[str], fields: Iterable[str] = FIELDS_ALL
+    ) -> list[Torrent]:
+        """Get torrents by torrent ids from snapshot, the backend call with the same name fetches current state"""
+        snapshot = await self.get_snapshot(fields)
+        return [snapshot[torrent_id] for torrent_id in torrent_ids if torrent_id in snapshot]
+
+    async def get_torrent(self, torrent_id: str, fields: Iterable[str] = FIELDS_ALL) -> Torrent | None:
+        """Get torrent by torrent id from snapshot"""
+        return (await self.get_snapshot(fields)).get(torrent_id)
+
+    async def fetch_torrent(self, torrent_id: str, fields: Iterable[str] = FIELDS_ALL) -> Torrent | None:
+        """Get torrent by torrent id from the client, bypassing the snapshot"""
+        return await self.client.get_torrent(torrent_id, fields=fields)
+
+    async def add_torrent(self, torrent_data: bytes | str, **kwargs) -> Torrent:
+        """Add torrent to client and invalidate snapshot"""
+        try:
+            return await self.client.add_torrent(torrent_data, **kwargs)
+        finally:
+            self.invalidate()
+
+    async def remove_torrent(self, torrent_id: str, delete_data: bool = True):
+        """Remove torrent from client and invalidate snapshot"""
+        try:
+            return await self.client.remove_torrent(torrent_id, delete_data=delete_data)
+        finally:
+            self.invalidate()
+
+    def close(self) -> None:
+        self.client.close()
@@ -0,0 +1,59 @@
+import asyncio
+import functools
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, TypeVar
+
+from torrent_telegram_bot import metrics
+from torrent_telegram_bot.custom_types import FIELDS_ALL, Torrent
+
+T = TypeVar("T")
+
+DEFAULT_WORKERS = 4
+
+REQUEST_SECONDS = metrics.histogram(
+    "torrent_client_request_seconds", "Torrent client library call duration", ("client", "method")
+)
+REQUEST_ERRORS = metrics.counter(
+    "torrent_client_request_errors_total", "Failed torrent client calls", ("client", "method")
+)
+
+
+class TorrentClient:
+    """Base torrent client class running blocking library calls in a bounded thread pool.
+
+    Subclasses keep a local mirror of the client torrent list and update it from the client
+    change feed in sync(), so steady state polling only transfers recently changed torrents.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, name: str = ""):
+        self.name = name or type(self).__name__.lower()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=type(self).__name__.lower())
+        self.sync_lock = asyncio.Lock()
+        self.mirror: dict[str, Torrent] = {}
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run blocking client call in the thread pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        method = getattr(func, "__name__", "call")
+        start = perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        except Exception:
+            REQUEST_ERRORS.inc(client=self.name, method=method)
+            raise
+        finally:
+            REQUEST_SECONDS.observe(perf_counter() - start, client=self.name, method=method)
+
+    async def sync(self, fields: Iterable[str] = FIELDS_ALL) -> dict[str, Torrent]:
+        """Apply torrent changes since the previous call to the local mirror and return it"""
+        raise NotImplementedError
+
+    async def get_torrents(self, fields: Iterable[str] = FIELDS_ALL) -> list[Torrent]:
+        """Get all torrents with at least the given fields from the synchronised local mirror"""
+        return list((await self.sync(fields)).values())
+
+    def close(self) -> None:
+        """Stop the thread pool, dropping calls that have not started yet"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,173 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Literal, TypeAlias, cast, get_args
+
+Permission: TypeAlias = Literal["all", "personal"]
+Notify: TypeAlias = Literal["all", "personal", "none"]
+
+REQUIRED_SECTIONS = ("telegram", "db")
+DEFAULT_CLIENT_NAME = "default"
+DEFAULT_WEBHOOK_LISTEN = "127.0.0.1"
+DEFAULT_WEBHOOK_PORT = 8443
+DEFAULT_WEBHOOK_MAX_CONNECTIONS = 40
+# telegram accepts 1-256 characters A-Z, a-z, 0-9, _ and - as webhook secret token
+SECRET_TOKEN_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+logger = logging.getLogger("transmission-telegram-bot")
+
+
+class ConfigError(ValueError):
+    """Configuration file has an invalid value."""
+
+
+def check_config(config: Any) -> None:
+    """Raise ConfigError if the config is not a mapping with every required section"""
+    if not isinstance(config, dict):
+        raise ConfigError("Configuration must be a mapping")
+    for section in REQUIRED_SECTIONS:
+        if not isinstance(config.get(section), dict):
+            raise ConfigError(f"Configuration section {section} is missing")
+    get_client_configs(config)
+    get_webhook_config(config)
+
+
+def get_client_configs(config: Any) -> list[dict[str, Any]]:
+    """Get torrent client sections from the clients list or the single client section.
+
+    Every section gets a unique name, the first one is the default client.
+    """
+    if "clients" in config:
+        clients = config["clients"]
+        if not isinstance(clients, list) or not clients:
+            raise ConfigError("clients must be a non-empty list")
+    elif isinstance(config.get("client"), dict):
+        clients = [{"name": DEFAULT_CLIENT_NAME, **config["client"]}]
+    else:
+        raise ConfigError("Configuration section client is missing")
+
+    sections: list[dict[str, Any]] = []
+    for client in clients:
+        if not isinstance(client, dict) or "name" not in client or "type" not in client:
+            raise ConfigError(f"Torrent client {client!r} must have a name and a type")
+        name = str(client["name"])
+        if not name or ":" in name:
+            raise ConfigError(f"Torrent client name {name!r} must be non-empty and must not contain ':'")
+        if any(section["name"] == name for section in sections):
+            raise ConfigError(f"Torrent client {name} is listed more than once")
+        sections.append({**client, "name": name})
+    return sections
+
+
+def get_webhook_config(config: Any) -> dict[str, Any] | None:
+    """Get the telegram.webhook section with defaults applied, None when updates are polled.
+
+    A secret token is required, otherwise anyone who finds the listener could post updates to the bot.
+    """
+    section = config["telegram"].get("webhook")
+    if not section:
+        return None
+    if not isinstance(section, dict) or not section.get("url"):
+        raise ConfigError("telegram.webhook must have the public url telegram sends updates to")
+    secret_token = str(section.get("secret_token") or "")
+    if not SECRET_TOKEN_RE.fullmatch(secret_token):
+        raise ConfigError("telegram.webhook.secret_token must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+    max_connections = int(section.get("max_connections", DEFAULT_WEBHOOK_MAX_CONNECTIONS))
+    if not 1 <= max_connections <= 100:
+        raise ConfigError("telegram.webhook.max_connections must be between 1 and 100")
+    return {
+        "url": str(section["url"]),
+        "secret_token": secret_token,
+        "listen": str(section.get("listen", DEFAULT_WEBHOOK_LISTEN)),
+        "port": int(section.get("port", DEFAULT_WEBHOOK_PORT)),
+        "path": str(section.get("path", "")).strip("/"),
+        "unix": section.get("unix"),
+        "max_connections": max_connections,
+        "cert": section.get("cert"),
+        "key": section.get("key"),
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class Chat:
+    """Allowed telegram chat"""
+
+    telegram_id: int
+    torrent_permission: Permission | None
+    notify: Notify = "personal"
+    allow_category: frozenset[str] | None = None
+
+    @classmethod
+    def from_config(cls, entry: Any) -> "Chat":
+        """Build chat from an allow_chat entry, raising ConfigError for invalid values"""
+        if not isinstance(entry, dict) or "telegram_id" not in entry:
+            raise ConfigError(f"allow_chat entry {entry!r} has no telegram_id")
+        try:
+            telegram_id = int(entry["telegram_id"])
+        except (TypeError, ValueError):
+            raise ConfigError(f"allow_chat telegram_id {entry['telegram_id']!r} is not a number") from None
+
+        permission = entry.get("torrent_permission")
+        if permission is None:
+            # such chats were always allowed to use the bot, they just see no torrents
+            logger.warning(f"Chat {telegram_id} has no torrent_permission, it can not list or delete torrents")
+        elif permission not in get_args(Permission):
+            raise ConfigError(f"Chat {telegram_id} has invalid torrent_permission {permission!r}")
+        notify = str(entry.get("notify", "personal"))
+        if notify not in get_args(Notify):
+            raise ConfigError(f"Chat {telegram_id} has invalid notify {notify!r}")
+
+        categories = entry.get("allow_category")
+        if categories is not None:
+            if not isinstance(categories, list):
+                raise ConfigError(f"Chat {telegram_id} allow_category must be a list")
+            categories = frozenset(str(category) for category in categories)
+        return cls(telegram_id, cast(Permission | None, permission), cast(Notify, notify), categories)
+
+
+class Acl:
+    """Allowed chats compiled from the telegram section of the config.
+
+    Chats are indexed by telegram id and chats notified about every torrent are kept in a set,
+    so access checks and notification routing never scan the allow_chat list.
+    """
+
+    def __init__(self, chats: list[Chat]):
+        self.chats: dict[int, Chat] = {}
+        for chat in chats:
+            if chat.telegram_id in self.chats:
+                raise ConfigError(f"Chat {chat.telegram_id} is listed in allow_chat more than once")
+            self.chats[chat.telegram_id] = chat
+        self.broadcast = frozenset(chat.telegram_id for chat in chats if chat.notify == "all")
+
+    @classmethod
+    def from_config(cls, config: Any) -> "Acl":
+        allow_chat = config.get("telegram", {}).get("allow_chat") or []
+        if not isinstance(allow_chat, list):
+            raise ConfigError("telegram.allow_chat must be a list")
+        return cls([Chat.from_config(entry) for entry in allow_chat])
+
+    def __contains__(self, chat_id: int | str) -> bool:
+        return self.get(chat_id) is not None
+
+    def get(self, chat_id: int | str) -> Chat | None:
+        try:
+            return self.chats.get(int(chat_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_permission(self, chat_id: int | str) -> Permission | None:
+        chat = self.get(chat_id)
+        return chat.torrent_permission if chat is not None else None
+
+    def get_categories(self, chat_id: int | str) -> frozenset[str] | None:
+        chat = self.get(chat_id)
+        return chat.allow_category if chat is not None else None
+
+    def get_notify_chats(self, uid: int | str) -> set[int]:
+        """Chats to notify about a torrent added by uid"""
+        chats = set(self.broadcast)
+        chat = self.get(uid)
+        if chat is not None and chat.notify == "personal":
+            chats.add(chat.telegram_id)
+        return chats
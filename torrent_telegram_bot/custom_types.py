@@ -1,29 +1,110 @@
 import datetime
+from collections.abc import Mapping
+from typing import Any, NamedTuple
 
+TRANSMISSION_STATUS = {
+    0: "stopped",
+    1: "check pending",
+    2: "checking",
+    3: "download pending",
+    4: "downloading",
+    5: "seed pending",
+    6: "seeding",
+}
 
-class Torrent:
-    def __init__(
-        self,
-        torrent_id: str,
-        name: str,
-        done_date: datetime.datetime | None,
-        status: str,
-        eta: datetime.timedelta | None,
-        progress: float,
-        download_speed: int,
-        upload_speed: int,
-        num_seeds_download: int,
-        num_seeds_upload: int,
-        ratio: float,
-    ):
-        self.torrent_id = torrent_id
-        self.name = name
-        self.done_date = done_date
-        self.status = status
-        self.eta = eta
-        self.progress = progress
-        self.download_speed = download_speed
-        self.upload_speed = upload_speed
-        self.num_seeds_download = num_seeds_download
-        self.num_seeds_upload = num_seeds_upload
-        self.ratio = ratio
+# qbittorrent reports 8640000 seconds (100 days) when the eta is unknown
+QBITTORRENT_ETA_INFINITY = 8640000
+
+
+class Torrent(NamedTuple):
+    """Immutable torrent record.
+
+    Dates are kept as raw client values, done_date and eta are only built when accessed.
+    """
+
+    torrent_id: str
+    name: str = ""
+    status: str = ""
+    done_timestamp: int = 0
+    eta_seconds: int = -1
+    progress: float = 0.0
+    download_speed: int = 0
+    upload_speed: int = 0
+    num_seeds_download: int = 0
+    num_seeds_upload: int = 0
+    ratio: float = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.done_timestamp > 0
+
+    @property
+    def done_date(self) -> datetime.datetime | None:
+        if self.done_timestamp <= 0:
+            return None
+        return datetime.datetime.fromtimestamp(self.done_timestamp, datetime.UTC)
+
+    @property
+    def eta(self) -> datetime.timedelta | None:
+        if self.eta_seconds < 0:
+            return None
+        return datetime.timedelta(seconds=self.eta_seconds)
+
+    @classmethod
+    def from_transmission(cls, fields: Mapping[str, Any]) -> "Torrent":
+        """Build torrent from transmission torrent-get fields, missing fields get empty values"""
+        get = fields.get
+        status = get("status")
+        return cls(
+            str(fields["id"]),
+            get("name", ""),
+            TRANSMISSION_STATUS.get(status, f"unknown status {status}") if status is not None else "",
+            get("doneDate", 0),
+            get("eta", -1),
+            round(100.0 * get("percentDone", 0), 2),
+            get("rateDownload", 0),
+            get("rateUpload", 0),
+            get("peersSendingToUs", 0),
+            get("peersGettingFromUs", 0),
+            float(get("uploadRatio", 0)),
+        )
+
+    @classmethod
+    def from_qbittorrent(cls, fields: Mapping[str, Any]) -> "Torrent":
+        """Build torrent from qbittorrent WebAPI torrent fields, missing fields get empty values"""
+        get = fields.get
+        eta = get("eta", -1)
+        peers = get("num_seeds", 0) + get("num_leechs", 0)
+        return cls(
+            str(fields["hash"]),
+            get("name", ""),
+            get("state", ""),
+            max(get("completion_on", 0), 0),
+            -1 if eta >= QBITTORRENT_ETA_INFINITY else eta,
+            get("progress", 0) * 100,
+            get("dlspeed", 0),
+            get("upspeed", 0),
+            peers,
+            peers,
+            get("ratio", 0.0),
+        )
+
+
+# Torrent attributes a view needs, backends fetch only the matching client fields
+FIELDS_ALL = frozenset(
+    {
+        "torrent_id",
+        "name",
+        "done_date",
+        "status",
+        "eta",
+        "progress",
+        "download_speed",
+        "upload_speed",
+        "num_seeds_download",
+        "num_seeds_upload",
+        "ratio",
+    }
+)
+FIELDS_NAME = frozenset({"torrent_id", "name"})
+FIELDS_STATUS = frozenset({"torrent_id", "name", "done_date", "eta"})
@@ -1,98 +1,475 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Any
 
 import aiosqlite
 
+from torrent_telegram_bot import metrics
+from torrent_telegram_bot.metainfo import Metainfo
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+QUERY_SECONDS = metrics.histogram(
+    "db_query_seconds", "Database call duration including the wait for a connection", ("query",)
+)
+QUERY_ERRORS = metrics.counter("db_query_errors_total", "Failed database calls", ("query",))
+
+
+def timed_query(func):
+    """Observe duration and failures of a DB method labeled with its name"""
+    return metrics.timed(QUERY_SECONDS, QUERY_ERRORS, query=func.__name__)(func)
+
+
+async def migrate_v1(conn: aiosqlite.Connection) -> None:
+    """Initial torrent table, also upgrades files created before completed_at was tracked"""
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS torrent (uid VARCHAR, torrent_id VARCHAR, complete BOOLEAN, completed_at INTEGER)"
+    )
+    cursor = await conn.execute("PRAGMA table_info(torrent)")
+    columns = [row[1] for row in await cursor.fetchall()]
+    await cursor.close()
+    if "completed_at" not in columns:
+        await conn.execute("ALTER TABLE torrent ADD COLUMN completed_at INTEGER")
+        await conn.execute("UPDATE torrent SET completed_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE complete=1")
+
+
+async def migrate_v2(conn: aiosqlite.Connection) -> None:
+    """Keyed torrent table with lookup indexes and added/completed timestamps"""
+    await conn.execute(
+        """
+        CREATE TABLE torrent_v2 (
+            torrent_id TEXT NOT NULL PRIMARY KEY,
+            uid TEXT NOT NULL,
+            complete INTEGER NOT NULL DEFAULT 0,
+            added_at INTEGER NOT NULL,
+            completed_at INTEGER
+        )
+        """
+    )
+    await conn.execute(
+        """
+        INSERT INTO torrent_v2 (torrent_id, uid, complete, added_at, completed_at)
+        SELECT torrent_id, MIN(uid), MAX(complete), CAST(strftime('%s', 'now') AS INTEGER), MAX(completed_at)
+        FROM torrent
+        WHERE torrent_id IS NOT NULL AND uid IS NOT NULL
+        GROUP BY torrent_id
+        """
+    )
+    await conn.execute("DROP TABLE torrent")
+    await conn.execute("ALTER TABLE torrent_v2 RENAME TO torrent")
+    await conn.execute("CREATE INDEX torrent_uid_idx ON torrent (uid)")
+    await conn.execute("CREATE INDEX torrent_incomplete_idx ON torrent (torrent_id, uid) WHERE complete = 0")
+
+
+async def migrate_v3(conn: aiosqlite.Connection) -> None:
+    """Outbound telegram message queue kept across restarts"""
+    await conn.execute(
+        """
+        CREATE TABLE outbox (
+            message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            send_at REAL NOT NULL
+        )
+        """
+    )
+    await conn.execute("CREATE INDEX outbox_send_at_idx ON outbox (send_at)")
+    await conn.execute("CREATE INDEX outbox_chat_idx ON outbox (chat_id, message_id)")
+
+
+async def migrate_v4(conn: aiosqlite.Connection) -> None:
+    """Info hash of added torrents and a cache of parsed torrent metainfo keyed by info hash"""
+    await conn.execute("ALTER TABLE torrent ADD COLUMN info_hash TEXT")
+    await conn.execute("CREATE INDEX torrent_info_hash_idx ON torrent (info_hash) WHERE info_hash IS NOT NULL")
+    await conn.execute(
+        """
+        CREATE TABLE metainfo (
+            info_hash TEXT NOT NULL PRIMARY KEY,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            files INTEGER NOT NULL,
+            piece_length INTEGER NOT NULL,
+            info_hash_v1 TEXT,
+            info_hash_v2 TEXT,
+            seen_at INTEGER NOT NULL
+        )
+        """
+    )
+    await conn.execute("CREATE INDEX metainfo_seen_at_idx ON metainfo (seen_at)")
+
+
+MIGRATIONS = [migrate_v1, migrate_v2, migrate_v3, migrate_v4]
+SCHEMA_VERSION = len(MIGRATIONS)
+
 
 class DBExceptionError(RuntimeError):
     """An SQLite DB error occured."""
 
 
 class DB(object):
+    """Application scoped SQLite handle with one writer and a pool of WAL readers"""
+
     def __init__(self):
         self.conn: aiosqlite.Connection
+        self.readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self.reader_conns: list[aiosqlite.Connection] = []
+        self.write_lock = asyncio.Lock()
 
     @classmethod
-    async def create(cls, db_path: str):
+    async def create(cls, db_path: str, readers: int = 2):
         self = cls()
         try:
             self.conn = await aiosqlite.connect(db_path)
+            await self.conn.execute("PRAGMA busy_timeout=5000")
+            await self.enable_incremental_vacuum()
+            if readers > 0:
+                await self.conn.execute("PRAGMA journal_mode=WAL")
         except Exception as exc:
             raise DBExceptionError(exc) from exc
         else:
-            await self.create_table()
-        return self
+            try:
+                await self.migrate()
+            except Exception:
+                await self.conn.close()
+                raise
 
-    async def create_table(self) -> None:
-        sql = "CREATE TABLE IF NOT EXISTS torrent (uid VARCHAR, torrent_id VARCHAR, complete BOOLEAN)"
         try:
-            await self.conn.execute(sql)
+            for _ in range(readers):
+                conn = await aiosqlite.connect(f"file:{db_path}?mode=ro", uri=True)
+                await conn.execute("PRAGMA busy_timeout=5000")
+                self.reader_conns.append(conn)
+                self.readers.put_nowait(conn)
         except Exception as exc:
-            await self.conn.rollback()
+            await self.close()
             raise DBExceptionError(exc) from exc
-        else:
-            await self.conn.commit()
+        return self
 
-    async def add_torrent(self, uid, torrent_id: str) -> None:
-        sql = "INSERT INTO torrent (uid, torrent_id, complete) VALUES (?,?,0)"
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read-only connection from the pool"""
+        if not self.reader_conns:
+            yield self.conn
+            return
+        conn = await self.readers.get()
         try:
-            await self.conn.execute(sql, (uid, torrent_id))
-        except Exception as exc:
-            await self.conn.rollback()
-            raise DBExceptionError(exc) from exc
-        else:
-            await self.conn.commit()
+            yield conn
+        finally:
+            self.readers.put_nowait(conn)
 
+    async def enable_incremental_vacuum(self) -> None:
+        """Switch the database file to incremental auto vacuum, rebuilding it once if needed"""
+        cursor = await self.conn.execute("PRAGMA auto_vacuum")
+        row = await cursor.fetchone()
+        await cursor.close()
+        if row is not None and row[0] != AUTO_VACUUM_INCREMENTAL:
+            await self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await self.conn.execute("VACUUM")
+
+    async def get_schema_version(self) -> int:
+        cursor = await self.conn.execute("SELECT MAX(version) FROM schema_version")
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row[0] if row is not None and row[0] is not None else 0
+
+    async def migrate(self) -> None:
+        """Bring the database schema up to SCHEMA_VERSION applying forward migrations in order"""
+        async with self.write_lock:
+            try:
+                await self.conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+                await self.conn.commit()
+                version = await self.get_schema_version()
+                if version > SCHEMA_VERSION:
+                    raise DBExceptionError(
+                        f"Database schema version {version} is newer than supported {SCHEMA_VERSION}"
+                    )
+                for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    await self.conn.execute("BEGIN")
+                    await migration(self.conn)
+                    await self.conn.execute("DELETE FROM schema_version")
+                    await self.conn.execute("INSERT INTO schema_version (version) VALUES (?)", (target,))
+                    await self.conn.commit()
+            except DBExceptionError:
+                raise
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+
+    async def add_torrent(self, uid, torrent_id: str, info_hash: str | None = None) -> None:
+        await self.add_torrents(uid, [(torrent_id, info_hash)])
+
+    @timed_query
+    async def add_torrents(self, uid, torrents: list[tuple[str, str | None]]) -> None:
+        """Store (torrent_id, info_hash) pairs of torrents added by uid"""
+        sql = (
+            "INSERT INTO torrent (uid, torrent_id, info_hash, complete, added_at) "
+            "VALUES (?, ?, ?, 0, CAST(strftime('%s', 'now') AS INTEGER)) "
+            # a completed torrent added again under the same client id, e.g. a qBittorrent hash, is tracked anew
+            "ON CONFLICT (torrent_id) DO UPDATE SET uid = excluded.uid, info_hash = excluded.info_hash, "
+            "complete = 0, added_at = excluded.added_at, completed_at = NULL WHERE complete = 1"
+        )
+        async with self.write_lock:
+            try:
+                await self.conn.executemany(sql, [(uid, torrent_id, info_hash) for torrent_id, info_hash in torrents])
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+
+    @timed_query
     async def list_uncomplete_torrents(self) -> Any:
-        sql = "SELECT * FROM torrent WHERE complete=0"
-        try:
-            cursor = await self.conn.execute(sql)
-            data = await cursor.fetchall()
-            await cursor.close()
-        except Exception as exc:
-            raise DBExceptionError(exc) from exc
-        else:
-            return data
+        sql = "SELECT uid, torrent_id, complete FROM torrent WHERE complete=0"
+        async with self.reader() as conn:
+            try:
+                cursor = await conn.execute(sql)
+                data = await cursor.fetchall()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
+            else:
+                return data
 
+    @timed_query
     async def get_torrent_by_uid(self, uid: str) -> Any:
-        sql = "SELECT * FROM torrent WHERE uid = ?"
-        try:
-            cursor = await self.conn.execute(sql, (uid,))
-            data = await cursor.fetchall()
-            await cursor.close()
-        except Exception as exc:
-            raise DBExceptionError(exc) from exc
-        else:
-            return data
+        sql = "SELECT uid, torrent_id, complete FROM torrent WHERE uid = ?"
+        async with self.reader() as conn:
+            try:
+                cursor = await conn.execute(sql, (uid,))
+                data = await cursor.fetchall()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
+            else:
+                return data
 
-    async def complete_torrent(self, torrent_id: str) -> None:
-        sql = "UPDATE torrent SET complete=1 WHERE torrent_id = ?"
-        try:
-            await self.conn.execute(sql, (torrent_id,))
-        except Exception as exc:
-            await self.conn.rollback()
-            raise DBExceptionError(exc) from exc
-        else:
-            await self.conn.commit()
+    @timed_query
+    async def get_torrent_by_info_hash(self, info_hash: str) -> Any:
+        """Get the torrent with info_hash, an incomplete one before torrents completed earlier"""
+        sql = (
+            "SELECT uid, torrent_id, complete FROM torrent WHERE info_hash = ? ORDER BY complete, added_at DESC LIMIT 1"
+        )
+        async with self.reader() as conn:
+            try:
+                cursor = await conn.execute(sql, (info_hash,))
+                data = await cursor.fetchone()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
+            else:
+                return data
+
+    @timed_query
+    async def get_torrent_by_id(self, torrent_id: str) -> Any:
+        sql = "SELECT uid, torrent_id, complete FROM torrent WHERE torrent_id = ?"
+        async with self.reader() as conn:
+            try:
+                cursor = await conn.execute(sql, (torrent_id,))
+                data = await cursor.fetchone()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
+            else:
+                return data
+
+    @timed_query
+    async def complete_torrent(self, torrent_id: str) -> bool:
+        """Mark torrent complete, return False if it was already complete or is unknown"""
+        sql = (
+            "UPDATE torrent SET complete=1, completed_at = CAST(strftime('%s', 'now') AS INTEGER) "
+            "WHERE torrent_id = ? AND complete=0"
+        )
+        async with self.write_lock:
+            try:
+                cursor = await self.conn.execute(sql, (torrent_id,))
+                completed = cursor.rowcount > 0
+                await cursor.close()
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+                return completed
 
+    @timed_query
     async def remove_torrent_by_id(self, torrent_id: str) -> None:
         sql = "DELETE FROM torrent WHERE torrent_id = ?"
-        try:
-            await self.conn.execute(sql, (torrent_id,))
-        except Exception as exc:
-            await self.conn.rollback()
-            raise DBExceptionError(exc) from exc
-        else:
-            await self.conn.commit()
-            await self.vacuum_db()
+        async with self.write_lock:
+            try:
+                await self.conn.execute(sql, (torrent_id,))
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
 
-    async def vacuum_db(self) -> None:
-        try:
-            await self.conn.execute("VACUUM")
-        except Exception as exc:
-            raise DBExceptionError(exc) from exc
+    @timed_query
+    async def prune_completed_torrents(self, retention: int) -> int:
+        """Remove completed torrents finished more than retention seconds ago"""
+        sql = "DELETE FROM torrent WHERE complete=1 AND completed_at < CAST(strftime('%s', 'now') AS INTEGER) - ?"
+        async with self.write_lock:
+            try:
+                cursor = await self.conn.execute(sql, (retention,))
+                removed = cursor.rowcount
+                await cursor.close()
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+                return removed
+
+    @timed_query
+    async def get_metainfo(self, info_hash: str) -> Metainfo | None:
+        sql = "SELECT name, size, files, piece_length, info_hash_v1, info_hash_v2 FROM metainfo WHERE info_hash = ?"
+        async with self.reader() as conn:
+            try:
+                cursor = await conn.execute(sql, (info_hash,))
+                row = await cursor.fetchone()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
+            else:
+                return Metainfo(*row) if row is not None else None
+
+    @timed_query
+    async def save_metainfo(self, metainfo: Metainfo) -> None:
+        """Cache parsed metainfo by info hash, refreshing seen_at of a known one"""
+        sql = (
+            "INSERT INTO metainfo (info_hash, name, size, files, piece_length, info_hash_v1, info_hash_v2, seen_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER)) "
+            "ON CONFLICT (info_hash) DO UPDATE SET seen_at = excluded.seen_at"
+        )
+        params = (
+            metainfo.info_hash,
+            metainfo.name,
+            metainfo.size,
+            metainfo.files,
+            metainfo.piece_length,
+            metainfo.info_hash_v1,
+            metainfo.info_hash_v2,
+        )
+        async with self.write_lock:
+            try:
+                await self.conn.execute(sql, params)
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+
+    @timed_query
+    async def prune_metainfo(self, retention: int) -> int:
+        """Remove cached metainfo not seen for retention seconds and not used by a stored torrent"""
+        sql = (
+            "DELETE FROM metainfo WHERE seen_at < CAST(strftime('%s', 'now') AS INTEGER) - ? "
+            "AND NOT EXISTS (SELECT 1 FROM torrent WHERE torrent.info_hash = metainfo.info_hash)"
+        )
+        async with self.write_lock:
+            try:
+                cursor = await self.conn.execute(sql, (retention,))
+                removed = cursor.rowcount
+                await cursor.close()
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+                return removed
+
+    @timed_query
+    async def enqueue_messages(self, messages: list[tuple[str, str]], send_at: float) -> None:
+        """Queue (chat_id, text) messages to be sent not earlier than send_at unix time"""
+        sql = (
+            "INSERT INTO outbox (chat_id, text, created_at, send_at) "
+            "VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER), ?)"
+        )
+        async with self.write_lock:
+            try:
+                await self.conn.executemany(sql, [(str(chat_id), text, send_at) for chat_id, text in messages])
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+
+    @timed_query
+    async def list_due_messages(self, now: float) -> Any:
+        """Messages due at now unix time, a chat is held back while an earlier message of it is postponed"""
+        sql = (
+            "SELECT message_id, chat_id, text, attempts FROM outbox AS o WHERE send_at <= ? AND NOT EXISTS "
+            "(SELECT 1 FROM outbox AS p WHERE p.chat_id = o.chat_id AND p.message_id < o.message_id AND p.send_at > ?) "
+            "ORDER BY message_id"
+        )
+        async with self.reader() as conn:
+            try:
+                cursor = await conn.execute(sql, (now, now))
+                data = await cursor.fetchall()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
+            else:
+                return data
+
+    @timed_query
+    async def get_next_send_at(self) -> float | None:
+        async with self.reader() as conn:
+            try:
+                cursor = await conn.execute("SELECT MIN(send_at) FROM outbox")
+                row = await cursor.fetchone()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
+            else:
+                return row[0] if row is not None else None
+
+    @timed_query
+    async def remove_messages(self, message_ids: list[int]) -> None:
+        sql = "DELETE FROM outbox WHERE message_id = ?"
+        async with self.write_lock:
+            try:
+                await self.conn.executemany(sql, [(message_id,) for message_id in message_ids])
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+
+    @timed_query
+    async def postpone_messages(self, message_ids: list[int], send_at: float, failed: bool = True) -> None:
+        """Move messages to send_at unix time, counting a failed attempt if failed is set"""
+        sql = "UPDATE outbox SET attempts = attempts + ?, send_at = ? WHERE message_id = ?"
+        async with self.write_lock:
+            try:
+                await self.conn.executemany(sql, [(int(failed), send_at, message_id) for message_id in message_ids])
+            except Exception as exc:
+                await self.conn.rollback()
+                raise DBExceptionError(exc) from exc
+            else:
+                await self.conn.commit()
+
+    @timed_query
+    async def maintenance(self, vacuum_pages: int = 0) -> None:
+        """Release free pages, refresh planner statistics and truncate the WAL file"""
+        async with self.write_lock:
+            try:
+                cursor = await self.conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+                await cursor.fetchall()
+                await cursor.close()
+                await self.conn.execute("PRAGMA optimize")
+                cursor = await self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                await cursor.fetchall()
+                await cursor.close()
+            except Exception as exc:
+                raise DBExceptionError(exc) from exc
 
     async def close(self) -> None:
         try:
+            for conn in self.reader_conns:
+                await conn.close()
+            self.reader_conns.clear()
             await self.conn.close()
         except Exception as exc:
             raise DBExceptionError(exc) from exc
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import re
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from urllib.parse import parse_qs
+
+from torrent_telegram_bot.httpserver import HttpServer, Request, Response
+
+DEFAULT_ADDRESS = "127.0.0.1"
+COMPLETE_PATH = "/complete"
+MAX_BODY = 4096
+# v1 info hash, v2 info hash or the v2 hash truncated to 40 characters as qBittorrent torrent id
+HASH_RE = re.compile(r"[0-9a-fA-F]{40}|[0-9a-fA-F]{64}")
+TORRENT_ID_RE = re.compile(r"[0-9A-Za-z]{1,64}")
+CLIENT_NAME_RE = re.compile(r"[^:\s]{1,64}")
+
+logger = logging.getLogger("transmission-telegram-bot")
+
+
+@dataclass(frozen=True, slots=True)
+class CompletionEvent:
+    """Torrent reported finished by a torrent client, by info hash, client torrent id or both"""
+
+    info_hash: str | None = None
+    torrent_id: str | None = None
+    client: str | None = None
+
+    @classmethod
+    def from_params(cls, params: dict[str, str]) -> "CompletionEvent":
+        """Build event from hash, id and client request parameters, raise ValueError if they are invalid"""
+        info_hash = params.get("hash") or None
+        torrent_id = params.get("id") or None
+        client = params.get("client") or None
+        if info_hash is not None and not HASH_RE.fullmatch(info_hash):
+            raise ValueError(f"Invalid torrent hash {info_hash!r}")
+        if torrent_id is not None and not TORRENT_ID_RE.fullmatch(torrent_id):
+            raise ValueError(f"Invalid torrent id {torrent_id!r}")
+        if client is not None and not CLIENT_NAME_RE.fullmatch(client):
+            raise ValueError(f"Invalid client name {client!r}")
+        if info_hash is None and torrent_id is None:
+            raise ValueError("Torrent hash or id is required")
+        return cls(info_hash.lower() if info_hash is not None else None, torrent_id, client)
+
+
+class EventServer(HttpServer):
+    """Minimal HTTP server accepting POST /complete from the torrent client done script.
+
+    Requests are answered as soon as the event is parsed, the callback runs in a background task so a slow
+    torrent client or Telegram never holds up the client that reported the torrent.
+    """
+
+    name = "Completion event"
+    max_body = MAX_BODY
+
+    def __init__(self, callback: Callable[[CompletionEvent], Awaitable[None]]):
+        super().__init__()
+        self.callback = callback
+        self.tasks: set[asyncio.Task] = set()
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def respond(self, request: Request) -> Response:
+        if request.method != "POST":
+            return Response("405 Method Not Allowed")
+        if request.path != COMPLETE_PATH:
+            return Response("404 Not Found")
+        query = request.query + "&" + request.body.decode()
+        try:
+            event = CompletionEvent.from_params({key: values[0] for key, values in parse_qs(query).items()})
+        except ValueError as exc:
+            logger.warning(f"Completion event rejected: {exc}")
+            return Response("400 Bad Request")
+        self.__dispatch(event)
+        return Response("202 Accepted")
+
+    def __dispatch(self, event: CompletionEvent) -> None:
+        task = asyncio.create_task(self.__run(event))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def __run(self, event: CompletionEvent) -> None:
+        try:
+            await self.callback(event)
+        except Exception as exc:
+            logger.error(f"Completion event error: {type(exc).__name__}({exc})")
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+DEFAULT_ADDRESS = "127.0.0.1"
+REQUEST_TIMEOUT = 10.0
+MAX_REQUEST_LINE = 8192
+
+logger = logging.getLogger("transmission-telegram-bot")
+
+
+@dataclass(frozen=True, slots=True)
+class Request:
+    """HTTP request, method and target are empty when the request line is malformed"""
+
+    method: str
+    path: str
+    query: str = ""
+    body: bytes = b""
+
+
+@dataclass(frozen=True, slots=True)
+class Response:
+    status: str
+    body: bytes = b""
+    content_type: str | None = None
+
+
+class HttpServer:
+    """Minimal HTTP server answering one request per connection.
+
+    The request has to arrive within REQUEST_TIMEOUT, lines are limited to MAX_REQUEST_LINE bytes and the body to
+    max_body bytes. Subclasses answer requests in respond, the connection is closed after every response.
+    """
+
+    name = "HTTP"
+    max_body = 0
+
+    def __init__(self):
+        self.server: asyncio.Server | None = None
+        self.unix: str | None = None
+
+    async def start(self, address: str = DEFAULT_ADDRESS, port: int = 0, unix: str | None = None) -> None:
+        """Listen on address and port, or on the unix socket when it is given"""
+        if unix:
+            self.server = await asyncio.start_unix_server(self.__handle, path=unix, limit=MAX_REQUEST_LINE)
+            self.unix = unix
+        else:
+            self.server = await asyncio.start_server(self.__handle, host=address, port=port, limit=MAX_REQUEST_LINE)
+
+    @property
+    def port(self) -> int | None:
+        if self.server is None or not self.server.sockets or self.unix:
+            return None
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.unix:
+            Path(self.unix).unlink(missing_ok=True)
+            self.unix = None
+
+    async def respond(self, request: Request) -> Response:
+        raise NotImplementedError
+
+    async def __read(self, reader: asyncio.StreamReader) -> Request:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        length = 0
+        while header := (await reader.readline()).strip():
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        if not 0 <= length <= self.max_body:
+            raise ValueError(f"Request body of {length} bytes is too large")
+        body = await reader.readexactly(length)
+        if len(request_line) < 2:
+            return Request("", "")
+        path, _, query = request_line[1].partition("?")
+        return Request(request_line[0], path, query, body)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            async with asyncio.timeout(REQUEST_TIMEOUT):
+                request = await self.__read(reader)
+            response = await self.respond(request)
+            headers = f"HTTP/1.1 {response.status}\r\n"
+            if response.content_type is not None:
+                headers += f"Content-Type: {response.content_type}\r\n"
+            headers += f"Content-Length: {len(response.body)}\r\nConnection: close\r\n\r\n"
+            writer.write(headers.encode() + (response.body if request.method != "HEAD" else b""))
+            await writer.drain()
+        except (TimeoutError, ValueError, ConnectionError, asyncio.IncompleteReadError) as exc:
+            logger.debug(f"{self.name} request error: {type(exc).__name__}({exc})")
+        finally:
+            writer.close()
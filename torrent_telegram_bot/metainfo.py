@@ -0,0 +1,242 @@
+import hashlib
+import re
+from base64 import b32decode
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+# limits applied before anything is decoded, telegram bots can download files of up to 20 MiB
+MAX_TORRENT_SIZE = 10 * 1024 * 1024
+MAX_DEPTH = 64
+MAX_INT_DIGITS = 20
+MAX_LENGTH_DIGITS = len(str(MAX_TORRENT_SIZE))
+PIECE_HASH_LENGTH = 20
+
+INTEGER_RE = re.compile(rb"-?(0|[1-9][0-9]*)")
+LENGTH_RE = re.compile(rb"0|[1-9][0-9]*")
+
+
+class MetainfoError(ValueError):
+    """Torrent file or magnet link could not be parsed."""
+
+
+@dataclass(frozen=True, slots=True)
+class Metainfo:
+    """Torrent identity and summary taken from a torrent file or magnet link"""
+
+    name: str
+    size: int = 0
+    files: int = 0
+    piece_length: int = 0
+    info_hash_v1: str | None = None
+    info_hash_v2: str | None = None
+
+    @property
+    def info_hash(self) -> str:
+        """Hash torrent clients identify the torrent by, v2 hashes are truncated to 40 characters like v1 ones"""
+        if self.info_hash_v1 is not None:
+            return self.info_hash_v1
+        if self.info_hash_v2 is not None:
+            return self.info_hash_v2[:40]
+        raise MetainfoError("Torrent has no info hash")
+
+
+class Decoder:
+    """Bencode decoder with size, nesting and number length limits.
+
+    Data is read in a single pass with an explicit stack instead of recursion, so hostile nesting cannot
+    exhaust the interpreter stack. The byte span of every top-level dictionary value is kept in spans,
+    hashes can then be computed over the original encoding without re-encoding it.
+    """
+
+    def __init__(self, data: bytes, max_size: int = MAX_TORRENT_SIZE, max_depth: int = MAX_DEPTH):
+        if len(data) > max_size:
+            raise MetainfoError(f"Data is larger than {max_size} bytes")
+        self.data = data
+        self.max_depth = max_depth
+        self.spans: dict[bytes, tuple[int, int]] = {}
+
+    def decode(self) -> Any:  # noqa: C901
+        data = self.data
+        end = len(data)
+        index = 0
+        stack: list[list | dict] = []
+        keys: list[bytes | None] = []
+        value_start = 0
+        while True:
+            if index >= end:
+                raise MetainfoError("Data is truncated")
+            token = data[index]
+            if token == 0x65:  # e
+                if not stack:
+                    raise MetainfoError(f"Unexpected end of container at {index}")
+                if keys[-1] is not None:
+                    raise MetainfoError(f"Dictionary key without value at {index}")
+                value = stack.pop()
+                keys.pop()
+                index += 1
+            elif token in (0x64, 0x6C):  # d, l
+                if stack and isinstance(stack[-1], dict) and keys[-1] is None:
+                    raise MetainfoError(f"Dictionary key is not a string at {index}")
+                if len(stack) >= self.max_depth:
+                    raise MetainfoError(f"Nesting is deeper than {self.max_depth} levels")
+                stack.append({} if token == 0x64 else [])
+                keys.append(None)
+                index += 1
+                continue
+            elif token == 0x69:  # i
+                stop = data.find(b"e", index + 1, index + MAX_INT_DIGITS + 2)
+                if stop < 0 or not INTEGER_RE.fullmatch(data, index + 1, stop) or data[index + 1 : stop] == b"-0":
+                    raise MetainfoError(f"Invalid integer at {index}")
+                value = int(data[index + 1 : stop])
+                index = stop + 1
+            elif 0x30 <= token <= 0x39:  # 0-9
+                colon = data.find(b":", index, index + MAX_LENGTH_DIGITS + 1)
+                if colon < 0 or not LENGTH_RE.fullmatch(data, index, colon):
+                    raise MetainfoError(f"Invalid string length at {index}")
+                start = colon + 1
+                index = start + int(data[index:colon])
+                if index > end:
+                    raise MetainfoError(f"String at {start} runs past the end of data")
+                value = data[start:index]
+            else:
+                raise MetainfoError(f"Invalid token at {index}")
+
+            if not stack:
+                if index != end:
+                    raise MetainfoError(f"Trailing data at {index}")
+                return value
+            container = stack[-1]
+            if isinstance(container, list):
+                container.append(value)
+            elif keys[-1] is None:
+                if not isinstance(value, bytes):
+                    raise MetainfoError(f"Dictionary key is not a string at {index}")
+                keys[-1] = value
+                if len(stack) == 1:
+                    value_start = index
+            else:
+                container[keys[-1]] = value
+                if len(stack) == 1:
+                    self.spans[keys[-1]] = (value_start, index)
+                keys[-1] = None
+
+
+def decode(data: bytes, max_size: int = MAX_TORRENT_SIZE, max_depth: int = MAX_DEPTH) -> Any:
+    """Decode bencoded data"""
+    return Decoder(data, max_size=max_size, max_depth=max_depth).decode()
+
+
+def parse_torrent(data: bytes, max_size: int = MAX_TORRENT_SIZE) -> Metainfo:
+    """Parse and validate torrent file content, info hashes are computed over the raw bencoded info dictionary"""
+    decoder = Decoder(data, max_size=max_size)
+    torrent = decoder.decode()
+    if not isinstance(torrent, dict):
+        raise MetainfoError("Torrent file is not a bencoded dictionary")
+    info = torrent.get(b"info")
+    if not isinstance(info, dict):
+        raise MetainfoError("Torrent file has no info dictionary")
+
+    name = info.get(b"name")
+    if not isinstance(name, bytes) or not name:
+        raise MetainfoError("Torrent has no name")
+    piece_length = info.get(b"piece length")
+    if not isinstance(piece_length, int) or piece_length <= 0:
+        raise MetainfoError("Torrent has an invalid piece length")
+
+    v1 = b"pieces" in info
+    v2 = info.get(b"meta version") == 2
+    if v1:
+        pieces = info[b"pieces"]
+        if not isinstance(pieces, bytes) or len(pieces) % PIECE_HASH_LENGTH:
+            raise MetainfoError("Torrent has invalid piece hashes")
+        files = get_v1_files(info)
+    elif v2:
+        files = get_v2_files(info.get(b"file tree"))
+    else:
+        raise MetainfoError("Torrent file has neither v1 pieces nor a v2 file tree")
+
+    start, end = decoder.spans[b"info"]
+    info_bytes = memoryview(data)[start:end]
+    return Metainfo(
+        name=name.decode("utf-8", errors="replace"),
+        size=sum(files),
+        files=len(files),
+        piece_length=piece_length,
+        info_hash_v1=hashlib.sha1(info_bytes, usedforsecurity=False).hexdigest() if v1 else None,
+        info_hash_v2=hashlib.sha256(info_bytes).hexdigest() if v2 else None,
+    )
+
+
+def get_v1_files(info: dict) -> list[int]:
+    """File lengths from a v1 single file length or multi file list"""
+    if b"length" in info:
+        lengths = [info[b"length"]]
+    elif isinstance(info.get(b"files"), list):
+        # BEP 47 padding files only align the next file to a piece boundary, they are not part of the content
+        lengths = [
+            entry.get(b"length") if isinstance(entry, dict) else None
+            for entry in info[b"files"]
+            if not is_padding_file(entry)
+        ]
+    else:
+        lengths = []
+    if not lengths:
+        raise MetainfoError("Torrent has no files")
+    files = [length for length in lengths if isinstance(length, int) and length >= 0]
+    if len(files) != len(lengths):
+        raise MetainfoError("Torrent has an invalid file length")
+    return files
+
+
+def is_padding_file(entry: Any) -> bool:
+    """BEP 47 padding files are marked with p in the attr string of their files entry"""
+    attr = entry.get(b"attr") if isinstance(entry, dict) else None
+    return isinstance(attr, bytes) and b"p" in attr
+
+
+def get_v2_files(file_tree: Any) -> list[int]:
+    """File lengths from a v2 file tree, walked without recursion"""
+    if not isinstance(file_tree, dict) or not file_tree:
+        raise MetainfoError("Torrent has no files")
+    files = []
+    trees = [file_tree]
+    while trees:
+        for key, value in trees.pop().items():
+            if not isinstance(value, dict):
+                raise MetainfoError("Torrent has an invalid file tree")
+            if key == b"":
+                length = value.get(b"length")
+                if not isinstance(length, int) or length < 0:
+                    raise MetainfoError("Torrent has an invalid file length")
+                files.append(length)
+            else:
+                trees.append(value)
+    return files
+
+
+def parse_magnet(magnet: str) -> Metainfo:
+    """Parse magnet link exact topics, hex and base32 v1 as well as multihash v2 ones are supported"""
+    query = parse_qs(urlparse(magnet).query)
+    v1 = v2 = None
+    try:
+        for topic in query.get("xt", []):
+            if topic.startswith("urn:btih:"):
+                value = topic[len("urn:btih:") :]
+                if len(value) == 40:
+                    v1 = bytes.fromhex(value).hex()
+                elif len(value) == 32:
+                    v1 = b32decode(value.upper()).hex()
+            elif topic.startswith("urn:btmh:1220") and len(topic) == len("urn:btmh:1220") + 64:
+                v2 = bytes.fromhex(topic[len("urn:btmh:1220") :]).hex()
+    except ValueError as exc:
+        raise MetainfoError("Magnet link has an invalid info hash") from exc
+    if v1 is None and v2 is None:
+        raise MetainfoError("Magnet link has no BitTorrent info hash")
+    size = query.get("xl", ["0"])[0]
+    return Metainfo(
+        name=query.get("dn", [v1 or v2 or ""])[0],
+        size=int(size) if size.isdigit() else 0,
+        info_hash_v1=v1,
+        info_hash_v2=v2,
+    )
@@ -0,0 +1,199 @@
+import functools
+import logging
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, ParamSpec, TypeVar
+
+from torrent_telegram_bot.httpserver import HttpServer, Request, Response
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_ADDRESS = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("transmission-telegram-bot")
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Metric family with a fixed set of label names, children are created on first use"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def collect(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: Any) -> float:
+        return self.values.get(self.key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{format_labels(dict(zip(self.labelnames, key, strict=True)))} {format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*sorted(buckets), float("inf"))
+        # per label values: count per bucket, sum and total count
+        self.values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self.key(labels)
+        if key not in self.values:
+            self.values[key] = ([0] * len(self.buckets), [0.0, 0])
+        counts, total = self.values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        total[0] += value
+        total[1] += 1
+
+    def get_count(self, **labels: Any) -> int:
+        entry = self.values.get(self.key(labels))
+        return int(entry[1][1]) if entry is not None else 0
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total) in self.values.items():
+            labels = dict(zip(self.labelnames, key, strict=True))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts, strict=True):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {cumulative}"
+            yield f"{self.name}_sum{format_labels(labels)} {format_value(total[0])}"
+            yield f"{self.name}_count{format_labels(labels)} {int(total[1])}"
+
+
+class Registry:
+    """Metric families rendered together in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "".join(line + "\n" for metric in self.metrics.values() for line in metric.collect())
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    """Create counter in the default registry"""
+    metric = Counter(name, documentation, labelnames)
+    REGISTRY.register(metric)
+    return metric
+
+
+def histogram(
+    name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+) -> Histogram:
+    """Create histogram in the default registry"""
+    metric = Histogram(name, documentation, labelnames, buckets)
+    REGISTRY.register(metric)
+    return metric
+
+
+def timed(
+    metric: Histogram, errors: Counter | None = None, **labels: Any
+) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    """Decorate coroutine function to observe its duration, exceptions are counted in errors when given"""
+
+    def decorator(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapped(*args: P.args, **kwargs: P.kwargs) -> T:
+            start = perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(**labels)
+                raise
+            finally:
+                metric.observe(perf_counter() - start, **labels)
+
+        return wrapped
+
+    return decorator
+
+
+class MetricsServer(HttpServer):
+    """Minimal HTTP server answering GET /metrics with the registry in Prometheus text format"""
+
+    name = "Metrics"
+
+    def __init__(self, registry: Registry = REGISTRY):
+        super().__init__()
+        self.registry = registry
+
+    async def respond(self, request: Request) -> Response:
+        if request.method not in ("GET", "HEAD"):
+            return Response("405 Method Not Allowed", content_type=CONTENT_TYPE)
+        if request.path != "/metrics":
+            return Response("404 Not Found", content_type=CONTENT_TYPE)
+        return Response("200 OK", self.registry.render().encode(), CONTENT_TYPE)
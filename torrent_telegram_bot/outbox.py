@@ -0,0 +1,212 @@
+import asyncio
+import datetime
+import logging
+from time import monotonic, time
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from torrent_telegram_bot import metrics
+from torrent_telegram_bot.db import DB
+from torrent_telegram_bot.tools import MESSAGE_MAX_LENGTH
+
+# telegram allows about 30 messages per second overall and one message per second to the same chat
+DEFAULT_SEND_RATE = 25.0
+DEFAULT_CHAT_SEND_RATE = 1.0
+DEFAULT_DIGEST_WINDOW = 10.0
+MAX_ATTEMPTS = 8
+RETRY_DELAY = 5.0
+RETRY_DELAY_MAX = 600.0
+IDLE_WAKEUP = 60.0
+
+MESSAGES_QUEUED = metrics.counter("outbox_messages_queued_total", "Notifications queued for sending")
+MESSAGES_SENT = metrics.counter("telegram_messages_sent_total", "Telegram messages sent, one per digest")
+MESSAGES_DROPPED = metrics.counter("outbox_messages_dropped_total", "Queued notifications that were never sent")
+SEND_SECONDS = metrics.histogram("telegram_send_seconds", "Telegram sendMessage duration")
+SEND_ERRORS = metrics.counter("telegram_send_errors_total", "Failed Telegram sends", ("error",))
+FLOOD_WAITS = metrics.counter("telegram_flood_waits_total", "Telegram flood control (429) responses")
+
+logger = logging.getLogger("transmission-telegram-bot")
+
+
+class TokenBucket:
+    """Token bucket refilled with rate tokens per second up to burst tokens"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self) -> float:
+        """Seconds to wait until a token is available"""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        wait = max(self.blocked_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def block(self, seconds: float) -> None:
+        """Hand out no tokens for the given number of seconds"""
+        self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+    @property
+    def idle(self) -> bool:
+        return self.delay() == 0 and self.tokens >= self.burst
+
+    async def acquire(self) -> None:
+        while (wait := self.delay()) > 0:
+            await asyncio.sleep(wait)
+        self.tokens -= 1
+
+
+class Outbox:
+    """Outbound telegram message dispatcher.
+
+    Messages are stored in the database before sending and survive restarts. Messages queued for the same
+    chat within digest_window seconds are merged into one, sending is paced by a global and a per chat
+    token bucket and flood control errors pause the whole queue for the requested time.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        db: DB,
+        rate: float = DEFAULT_SEND_RATE,
+        chat_rate: float = DEFAULT_CHAT_SEND_RATE,
+        digest_window: float = DEFAULT_DIGEST_WINDOW,
+    ):
+        self.bot = bot
+        self.db = db
+        self.digest_window = digest_window
+        self.chat_rate = chat_rate
+        self.bucket = TokenBucket(rate, burst=max(rate, 1.0))
+        self.chat_buckets: dict[str, TokenBucket] = {}
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def configure(
+        self,
+        rate: float = DEFAULT_SEND_RATE,
+        chat_rate: float = DEFAULT_CHAT_SEND_RATE,
+        digest_window: float = DEFAULT_DIGEST_WINDOW,
+    ) -> None:
+        """Apply new send limits, used on config reload"""
+        self.digest_window = digest_window
+        self.bucket.rate = rate
+        self.bucket.burst = max(rate, 1.0)
+        if chat_rate != self.chat_rate:
+            self.chat_rate = chat_rate
+            for bucket in self.chat_buckets.values():
+                bucket.rate = chat_rate
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.__run(), name="outbox")
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def send(self, chat_ids: list[str], text: str) -> None:
+        """Queue text for every chat, it is sent once the digest window is over"""
+        if not chat_ids:
+            return
+        await self.db.enqueue_messages([(str(chat_id), text) for chat_id in chat_ids], time() + self.digest_window)
+        MESSAGES_QUEUED.inc(len(chat_ids))
+        self.wakeup.set()
+
+    async def __run(self) -> None:
+        while True:
+            self.wakeup.clear()
+            try:
+                await self.dispatch()
+                next_send_at = await self.db.get_next_send_at()
+            except Exception as exc:
+                logger.error(f"{type(exc).__name__}({exc})")
+                wait = RETRY_DELAY
+            else:
+                wait = IDLE_WAKEUP if next_send_at is None else min(max(next_send_at - time(), 0.0), IDLE_WAKEUP)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+            except TimeoutError:
+                pass
+
+    async def dispatch(self) -> None:
+        """Send every due message, one digest per chat"""
+        chats: dict[str, list[tuple[int, str, int]]] = {}
+        for message_id, chat_id, text, attempts in await self.db.list_due_messages(time()):
+            chats.setdefault(chat_id, []).append((message_id, text, attempts))
+        if not chats:
+            return
+        await asyncio.gather(*(self.__send_chat(chat_id, messages) for chat_id, messages in chats.items()))
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items() if bucket.idle]:
+            del self.chat_buckets[chat_id]
+
+    async def __send_chat(self, chat_id: str, messages: list[tuple[int, str, int]]) -> None:
+        chat_bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate))
+        digests = make_digests(messages)
+        for index, (message_ids, text) in enumerate(digests):
+            await chat_bucket.acquire()
+            await self.bucket.acquire()
+            try:
+                with SEND_SECONDS.time():
+                    await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+            except RetryAfter as exc:
+                FLOOD_WAITS.inc()
+                retry_after = exc.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"Telegram flood control, sending is paused for {retry_after} seconds")
+                self.bucket.block(retry_after)
+                chat_bucket.block(retry_after)
+                pending = [message_id for ids, _ in digests[index:] for message_id in ids]
+                await self.db.postpone_messages(pending, time() + retry_after, failed=False)
+                return
+            except (BadRequest, Forbidden) as exc:
+                logger.error(f"Message to chat {chat_id} was dropped: {type(exc).__name__}({exc})")
+                SEND_ERRORS.inc(error=type(exc).__name__)
+                MESSAGES_DROPPED.inc(len(message_ids))
+                await self.db.remove_messages(message_ids)
+            except TelegramError as exc:
+                logger.error(f"{type(exc).__name__}({exc})")
+                SEND_ERRORS.inc(error=type(exc).__name__)
+                await self.__retry(messages, [message_id for ids, _ in digests[index:] for message_id in ids])
+                return
+            else:
+                MESSAGES_SENT.inc()
+                await self.db.remove_messages(message_ids)
+
+    async def __retry(self, messages: list[tuple[int, str, int]], message_ids: list[int]) -> None:
+        """Postpone failed messages with exponential backoff, dropping those out of attempts"""
+        attempts = max(attempt for message_id, _, attempt in messages if message_id in message_ids)
+        if attempts + 1 >= MAX_ATTEMPTS:
+            logger.error(f"{len(message_ids)} message(s) were dropped after {MAX_ATTEMPTS} attempts")
+            MESSAGES_DROPPED.inc(len(message_ids))
+            await self.db.remove_messages(message_ids)
+        else:
+            delay = min(RETRY_DELAY * 2**attempts, RETRY_DELAY_MAX)
+            await self.db.postpone_messages(message_ids, time() + delay)
+
+
+def make_digests(
+    messages: list[tuple[int, str, int]], max_length: int = MESSAGE_MAX_LENGTH
+) -> list[tuple[list[int], str]]:
+    """Merge queued messages into as few texts of at most max_length as possible"""
+    digests: list[tuple[list[int], str]] = []
+    for message_id, text, _ in messages:
+        if digests and len(digests[-1][1]) + len(text) + 1 <= max_length:
+            message_ids, digest = digests[-1]
+            digests[-1] = ([*message_ids, message_id], f"{digest}\n{text}")
+        else:
+            digests.append(([message_id], text))
+    return digests
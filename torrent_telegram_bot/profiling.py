@@ -0,0 +1,158 @@
+import asyncio
+import cProfile
+import io
+import logging
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from collections.abc import Awaitable
+from pathlib import Path
+from time import perf_counter
+from types import FrameType
+from typing import TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_PROFILE_DIR = "profiles"
+DEFAULT_SLOW_THRESHOLD = 1.0
+DEFAULT_PROFILE_PERIOD = 300
+DEFAULT_SAMPLE_INTERVAL = 0.01
+TRACEMALLOC_FRAMES = 10
+TRACEMALLOC_TOP = 10
+MAX_STACK_DEPTH = 128
+
+logger = logging.getLogger("transmission-telegram-bot")
+
+
+def fold_stack(frame: FrameType | None) -> str:
+    """Format frame chain root first as one collapsed stack line entry"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{Path(code.co_filename).name}:{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """Thread sampling the stack of another thread into collapsed stack counts, the flamegraph input format"""
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = fold_stack(frame)
+            with self.lock:
+                self.stacks[stack] += 1
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def dump(self, path: Path) -> None:
+        with self.lock:
+            lines = [f"{stack} {count}\n" for stack, count in self.stacks.most_common()]
+        path.write_text("".join(lines))
+
+
+class Profiler:
+    """Profiling mode: deterministic and sampling profiles, slow handler detection and memory growth reports.
+
+    cProfile runs for the whole process rather than per handler, because concurrent tasks interleave on one
+    thread and only one profiler can be active at a time. Handlers and jobs are timed individually instead.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_PROFILE_DIR,
+        slow_threshold: float = DEFAULT_SLOW_THRESHOLD,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ):
+        self.directory = Path(directory)
+        self.slow_threshold = slow_threshold
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), sample_interval)
+        self.snapshot: tracemalloc.Snapshot | None = None
+
+    def start(self) -> None:
+        """Start profiling the calling thread, which must be the one running the event loop"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sampler.thread_id = threading.get_ident()
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.snapshot = self.take_snapshot()
+        self.sampler.start()
+        self.profile.enable()
+        logger.info(f"Profiling is enabled, profiles are written to {self.directory.resolve()}")
+
+    def stop(self) -> None:
+        self.dump()
+        self.profile.disable()
+        self.sampler.stop()
+        tracemalloc.stop()
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await handler or job, logging its stack if it runs longer than the slow threshold"""
+        start = perf_counter()
+        watchdog = asyncio.get_running_loop().call_later(
+            self.slow_threshold, self.__report_running, name, asyncio.current_task()
+        )
+        try:
+            return await awaitable
+        finally:
+            watchdog.cancel()
+            duration = perf_counter() - start
+            if duration >= self.slow_threshold:
+                logger.warning(f"Slow {name} took {duration:.3f} seconds")
+
+    def __report_running(self, name: str, task: asyncio.Task | None) -> None:
+        stack = io.StringIO()
+        if task is not None:
+            task.print_stack(file=stack)
+        logger.warning(f"Slow {name} is still running after {self.slow_threshold} seconds\n{stack.getvalue()}")
+
+    def dump(self) -> None:
+        """Write profiles collected since start as pstats and collapsed stacks, replacing the previous ones"""
+        self.profile.disable()
+        try:
+            self.__replace(self.directory / "profile.pstats", self.profile.dump_stats)
+        finally:
+            self.profile.enable()
+        self.__replace(self.directory / "profile.folded", self.sampler.dump)
+
+    @staticmethod
+    def __replace(path: Path, write) -> None:
+        temp = path.with_suffix(path.suffix + ".tmp")
+        write(temp)
+        temp.replace(path)
+
+    @staticmethod
+    def take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            )
+        )
+
+    def report(self) -> None:
+        """Dump profiles and log the allocation sites that grew the most since the previous report"""
+        self.dump()
+        snapshot = self.take_snapshot()
+        if self.snapshot is not None:
+            lines = [str(stat) for stat in snapshot.compare_to(self.snapshot, "lineno")[:TRACEMALLOC_TOP]]
+            current, peak = tracemalloc.get_traced_memory()
+            logger.info(
+                f"Traced memory {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB, top growth:\n"
+                + "\n".join(lines)
+            )
+        self.snapshot = snapshot
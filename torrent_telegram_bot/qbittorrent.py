@@ -1,15 +1,23 @@
-import secrets
-import string
-from datetime import datetime, timedelta
-from time import sleep
-from zoneinfo import ZoneInfo
+import asyncio
+from collections.abc import Iterable
+from typing import Any
 
 from qbittorrentapi import Client
 
-from torrent_telegram_bot.custom_types import Torrent
+from torrent_telegram_bot.client import DEFAULT_WORKERS, TorrentClient
+from torrent_telegram_bot.custom_types import FIELDS_ALL, Torrent
+from torrent_telegram_bot.metainfo import parse_magnet, parse_torrent
 
+ADD_POLL_INTERVAL = 0.2
+ADD_TIMEOUT = 30
 
-class Qbittorrent:
+# partial sync/maindata updates are merged into these fields, everything else is not kept
+MIRROR_FIELDS = frozenset(
+    {"name", "state", "completion_on", "eta", "progress", "dlspeed", "upspeed", "num_seeds", "num_leechs", "ratio"}
+)
+
+
+class Qbittorrent(TorrentClient):
     """Simple torrent client class"""
 
     def __init__(
@@ -18,106 +26,98 @@ class Qbittorrent:
         port: int = 8080,
         user: str = "",
         password: str = "",
+        workers: int = DEFAULT_WORKERS,
+        name: str = "",
     ):
+        super().__init__(workers=workers, name=name)
         self.address = address
         self.port = port
         self.user = user
         self.password = password
         self.client = self.__get_client()
+        self.rid = 0
+        self.raw: dict[str, dict[str, Any]] = {}
 
     def __get_client(self) -> Client:
         """Construct qbittorrent client instance"""
         return Client(host=self.address, port=self.port, username=self.user, password=self.password)
 
-    def __generate_random_string(self, length):
-        characters = string.ascii_letters + string.digits
-        random_string = "".join(secrets.choice(characters) for i in range(length))
-        return random_string
-
-    def get_torrents(self) -> list[Torrent]:
-        """Get all torrents from client"""
-        torrents = self.client.torrents_info()
+    async def sync(self, fields: Iterable[str] = FIELDS_ALL) -> dict[str, Torrent]:
+        """Update local mirror with the changes reported by sync/maindata since the last response id.
+
+        The WebAPI has no field selection, sync/maindata already sends only the changed fields.
+        """
+        async with self.sync_lock:
+            try:
+                data = await self.run(self.client.sync_maindata, rid=self.rid)
+                if data.get("full_update"):
+                    self.raw.clear()
+                    self.mirror.clear()
+                removed = data.get("torrents_removed")
+                for torrent_hash in removed if isinstance(removed, list) else []:
+                    self.raw.pop(str(torrent_hash), None)
+                    self.mirror.pop(str(torrent_hash), None)
+                torrents = data.get("torrents")
+                for torrent_hash, changes in (torrents if isinstance(torrents, dict) else {}).items():
+                    if not isinstance(changes, dict):
+                        continue
+                    raw = self.raw.setdefault(torrent_hash, {"hash": torrent_hash})
+                    raw.update((key, value) for key, value in changes.items() if key in MIRROR_FIELDS)
+                    self.mirror[torrent_hash] = Torrent.from_qbittorrent(raw)
+            except Exception:
+                self.rid = 0
+                raise
+            self.rid = data.get("rid", 0)
+            return self.mirror
+
+    async def get_torrents_by_ids(
+        self, torrent_ids: Iterable[str], fields: Iterable[str] = FIELDS_ALL
+    ) -> list[Torrent]:
+        """Get torrents by torrent hashes with a single request"""
+        hashes = list(torrent_ids)
+        if not hashes:
+            return []
         return [
-            Torrent(
-                torrent_id=str(torrent.hash),
-                name=torrent.name,
-                done_date=datetime.fromtimestamp(
-                    0 if torrent.completion_on < 0 else torrent.completion_on, ZoneInfo("UTC")
-                ).replace(tzinfo=None),
-                eta=timedelta(seconds=torrent.eta),
-                status=torrent.state,
-                progress=torrent.progress * 100,
-                download_speed=torrent.dlspeed,
-                upload_speed=torrent.upspeed,
-                num_seeds_download=torrent.num_seeds + torrent.num_leechs,
-                num_seeds_upload=torrent.num_seeds + torrent.num_leechs,
-                ratio=torrent.ratio,
-            )
-            for torrent in torrents
+            Torrent.from_qbittorrent(torrent)
+            for torrent in await self.run(self.client.torrents_info, torrent_hashes=hashes)
         ]
 
-    def get_torrent(self, torrent_id: str) -> Torrent | None:
-        """Get torrent by torrent id"""
-        torrents = self.client.torrents_info()
-        for torrent in torrents:
-            if torrent.hash == torrent_id:
-                return Torrent(
-                    torrent_id=str(torrent.hash),
-                    name=torrent.name,
-                    done_date=datetime.fromtimestamp(
-                        0 if torrent.completion_on < 0 else torrent.completion_on, ZoneInfo("UTC")
-                    ).replace(tzinfo=None),
-                    eta=timedelta(seconds=torrent.eta),
-                    status=torrent.state,
-                    progress=torrent.progress * 100,
-                    download_speed=torrent.dlspeed,
-                    upload_speed=torrent.upspeed,
-                    num_seeds_download=torrent.num_seeds + torrent.num_leechs,
-                    num_seeds_upload=torrent.num_seeds + torrent.num_leechs,
-                    ratio=torrent.ratio,
-                )
-
-    def remove_torrent(self, torrent_id: str, delete_data: bool = True):
+    async def get_torrent(self, torrent_id: str, fields: Iterable[str] = FIELDS_ALL) -> Torrent | None:
+        """Get torrent by torrent hash"""
+        torrents = await self.get_torrents_by_ids([torrent_id], fields=fields)
+        if torrents:
+            return torrents[0]
+        return None
+
+    async def remove_torrent(self, torrent_id: str, delete_data: bool = True):
         """Remove torrent by torrent hash"""
-        return self.client.torrents_delete(torrent_hashes=torrent_id, delete_files=delete_data)
+        return await self.run(self.client.torrents_delete, torrent_hashes=torrent_id, delete_files=delete_data)
+
+    async def add_torrent(
+        self, torrent_data: bytes | str, timeout: float = ADD_TIMEOUT, info_hash: str | None = None, **kwargs
+    ) -> Torrent:
+        """Add torrent file content or magnet link to client and fetch it by its info hash.
 
-    def add_torrent(self, torrent_data: bytes, **kwargs) -> Torrent:
-        """Add torrent to client"""
-        temp_category = self.__generate_random_string(6)
+        The hash is computed locally unless given, the torrent is looked up for at most timeout seconds.
+        """
+        if info_hash is None:
+            metainfo = parse_magnet(torrent_data) if isinstance(torrent_data, str) else parse_torrent(torrent_data)
+            info_hash = metainfo.info_hash
 
+        # magnet links are passed as urls, torrent file content as files
+        source = {"urls": torrent_data} if isinstance(torrent_data, str) else {"torrent_files": torrent_data}
         if "download_dir" in kwargs:
-            result = self.client.torrents_add(
-                torrent_files=torrent_data, save_path=kwargs.get("download_dir"), category=temp_category
-            )
+            result = await self.run(self.client.torrents_add, **source, save_path=kwargs.get("download_dir"))
         else:
-            result = self.client.torrents_add(torrent_files=torrent_data, category=temp_category)
+            result = await self.run(self.client.torrents_add, **source)
 
         if result != "Ok.":
             raise Exception("Error adding torrent")
 
-        while True:
-            torrents = self.client.torrents_info(category=temp_category)
-            if len(torrents) > 0:
-                break
-            else:
-                sleep(1)
-
-        torrent = torrents[0]
-
-        self.client.torrents_remove_categories(categories=temp_category)
-
-        return Torrent(
-            torrent_id=str(torrent.hash),
-            name=torrent.name,
-            done_date=datetime.fromtimestamp(
-                0 if torrent.completion_on < 0 else torrent.completion_on, ZoneInfo("UTC")
-            ).replace(tzinfo=None),
-            eta=timedelta(seconds=torrent.eta),
-            status=torrent.state,
-            progress=torrent.progress * 100,
-            download_speed=torrent.dlspeed,
-            upload_speed=torrent.upspeed,
-            num_seeds_download=torrent.num_seeds + torrent.num_leechs,
-            num_seeds_upload=torrent.num_seeds + torrent.num_leechs,
-            ratio=torrent.ratio,
-        )
+        # qbittorrent registers added torrents asynchronously, usually before the first lookup
+        async with asyncio.timeout(timeout):
+            while True:
+                torrents = await self.run(self.client.torrents_info, torrent_hashes=info_hash)
+                if len(torrents) > 0:
+                    return Torrent.from_qbittorrent(torrents[0])
+                await asyncio.sleep(ADD_POLL_INTERVAL)
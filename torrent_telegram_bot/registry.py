@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Iterable
+from typing import TypeVar
+
+from torrent_telegram_bot.cache import TorrentCache
+from torrent_telegram_bot.custom_types import FIELDS_ALL, Torrent
+
+T = TypeVar("T")
+
+DEFAULT_CLIENT_TIMEOUT = 10.0
+
+logger = logging.getLogger("transmission-telegram-bot")
+
+
+class ClientRegistry:
+    """Several torrent client instances behind the torrent client interface.
+
+    Torrent ids are namespaced as backend:id, ids without a known backend prefix belong to the default
+    backend. Listing calls fan out to every backend concurrently, a backend that fails or does not answer
+    within its timeout is logged and skipped, so a slow or down node does not stall the others.
+    """
+
+    def __init__(
+        self,
+        clients: dict[str, TorrentCache],
+        timeouts: dict[str, float] | None = None,
+        default: str | None = None,
+    ):
+        if not clients:
+            raise ValueError("At least one torrent client is required")
+        self.clients = clients
+        self.timeouts = timeouts or {}
+        self.default = default if default is not None else next(iter(clients))
+
+    def split(self, torrent_id: str) -> tuple[str, str]:
+        """Split namespaced torrent id into backend name and client torrent id"""
+        name, sep, client_id = torrent_id.partition(":")
+        if sep and name in self.clients:
+            return name, client_id
+        return self.default, torrent_id
+
+    def get(self, name: str | None = None) -> TorrentCache:
+        return self.clients[name if name is not None else self.default]
+
+    async def __call(self, name: str, call: Awaitable[T]) -> T:
+        async with asyncio.timeout(self.timeouts.get(name, DEFAULT_CLIENT_TIMEOUT)):
+            return await call
+
+    async def __fan_out(self, calls: dict[str, Awaitable[T]]) -> dict[str, T]:
+        """Run calls per backend concurrently, returning results of backends that answered in time"""
+        names = list(calls)
+        results = await asyncio.gather(*(self.__call(name, calls[name]) for name in names), return_exceptions=True)
+        answered: dict[str, T] = {}
+        for name, result in zip(names, results, strict=True):
+            if isinstance(result, BaseException):
+                if isinstance(result, asyncio.CancelledError):
+                    raise result
+                error = "timeout" if isinstance(result, TimeoutError) else f"{type(result).__name__}({result})"
+                logger.error(f"Torrent client {name} error: {error}")
+            else:
+                answered[name] = result
+        return answered
+
+    async def get_torrents(self, fields: Iterable[str] = FIELDS_ALL) -> list[Torrent]:
+        """Get torrents of every backend that answered in time"""
+        fields = frozenset(fields)
+        results = await self.__fan_out({name: client.get_torrents(fields) for name, client in self.clients.items()})
+        return [
+            torrent._replace(torrent_id=f"{name}:{torrent.torrent_id}")
+            for name, torrents in results.items()
+            for torrent in torrents
+        ]
+
+    async def get_torrents_by_ids(
+        self,
+        torrent_ids: Iterable[str],
+        fields: Iterable[str] = FIELDS_ALL,
+        unavailable: set[str] | None = None,
+    ) -> list[Torrent]:
+        """Get torrents by torrent ids, torrents keep the id form they were requested with.
+
+        Ids of backends that did not answer are added to unavailable when it is given.
+        """
+        fields = frozenset(fields)
+        requested: dict[str, dict[str, str]] = {}
+        for torrent_id in torrent_ids:
+            name, client_id = self.split(torrent_id)
+            requested.setdefault(name, {})[client_id] = torrent_id
+
+        results = await self.__fan_out(
+            {name: self.clients[name].get_torrents_by_ids(ids, fields=fields) for name, ids in requested.items()}
+        )
+        torrents = []
+        for name, ids in requested.items():
+            if name not in results:
+                if unavailable is not None:
+                    unavailable.update(ids.values())
+                continue
+            for torrent in results[name]:
+                torrents.append(torrent._replace(torrent_id=ids.get(torrent.torrent_id, torrent.torrent_id)))
+        return torrents
+
+    async def get_torrent(self, torrent_id: str, fields: Iterable[str] = FIELDS_ALL) -> Torrent | None:
+        """Get torrent by torrent id"""
+        name, client_id = self.split(torrent_id)
+        torrent = await self.__call(name, self.clients[name].get_torrent(client_id, fields=fields))
+        return torrent._replace(torrent_id=torrent_id) if torrent is not None else None
+
+    async def fetch_torrent(self, torrent_id: str, fields: Iterable[str] = FIELDS_ALL) -> Torrent | None:
+        """Get torrent by torrent id from its backend, bypassing the snapshot of the backend"""
+        name, client_id = self.split(torrent_id)
+        torrent = await self.__call(name, self.clients[name].fetch_torrent(client_id, fields=fields))
+        return torrent._replace(torrent_id=torrent_id) if torrent is not None else None
+
+    async def add_torrent(self, torrent_data: bytes | str, backend: str | None = None, **kwargs) -> Torrent:
+        """Add torrent to backend, the default one if not given, and return it with namespaced id"""
+        name = backend if backend is not None else self.default
+        torrent = await self.clients[name].add_torrent(torrent_data, **kwargs)
+        return torrent._replace(torrent_id=f"{name}:{torrent.torrent_id}")
+
+    async def remove_torrent(self, torrent_id: str, delete_data: bool = True):
+        """Remove torrent by torrent id"""
+        name, client_id = self.split(torrent_id)
+        return await self.__call(name, self.clients[name].remove_torrent(client_id, delete_data=delete_data))
+
+    def close(self) -> None:
+        for client in self.clients.values():
+            client.close()
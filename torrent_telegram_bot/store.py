@@ -0,0 +1,62 @@
+import secrets
+from collections import OrderedDict
+from time import monotonic
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_MAXSIZE = 256
+DEFAULT_TTL = 3600
+
+
+class TokenStore(Generic[T]):
+    """In-memory LRU map from short opaque tokens to values, entries expire ttl seconds after the last access.
+
+    Tokens are short enough to be carried in Telegram callback data instead of the values themselves.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, T]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def put(self, value: T) -> str:
+        """Store value and return new token for it"""
+        self.expire()
+        token = secrets.token_urlsafe(6)
+        while token in self.entries:
+            token = secrets.token_urlsafe(6)
+        self.entries[token] = (monotonic(), value)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> T | None:
+        """Get value by token and refresh its expiration, None if the token is unknown or expired"""
+        entry = self.entries.get(token)
+        if entry is None:
+            return None
+        if monotonic() - entry[0] > self.ttl:
+            del self.entries[token]
+            return None
+        self.entries[token] = (monotonic(), entry[1])
+        self.entries.move_to_end(token)
+        return entry[1]
+
+    def pop(self, token: str) -> T | None:
+        """Remove token and return its value, None if the token is unknown or expired"""
+        value = self.get(token)
+        self.entries.pop(token, None)
+        return value
+
+    def expire(self) -> None:
+        """Drop entries not accessed within ttl seconds"""
+        deadline = monotonic() - self.ttl
+        while self.entries:
+            token, (accessed_at, _) = next(iter(self.entries.items()))
+            if accessed_at > deadline:
+                break
+            del self.entries[token]
@@ -1,10 +1,10 @@
 import logging
 from pathlib import Path
-from typing import Any, Literal, TypeAlias
 
 import yaml
 
-Permission: TypeAlias = Literal["all", "personal"]
+# leave room for the page header in the 4096 characters Telegram allows per message
+MESSAGE_MAX_LENGTH = 4000
 
 
 def humanize_bytes(speed: float, suffix: str = "B"):
@@ -47,30 +47,19 @@ def get_config(path: str):
     return cfg
 
 
-def get_torrent_permission(config: Any, chat_id: str) -> Permission | None:
-    if "allow_chat" in config["telegram"]:
-        if config["telegram"]["allow_chat"]:
-            torrent_permission = None
-            for entry in config["telegram"]["allow_chat"]:
-                if entry["telegram_id"] == chat_id:
-                    torrent_permission = entry["torrent_permission"]
-            return torrent_permission
-        else:
-            return None
-    else:
-        return None
-
-
-def get_torrent_category(config: Any, chat_id: str):
-    if "allow_chat" in config["telegram"]:
-        if config["telegram"]["allow_chat"]:
-            torrent_category = None
-            for entry in config["telegram"]["allow_chat"]:
-                if entry["telegram_id"] == chat_id:
-                    if "allow_category" in entry:
-                        torrent_category = entry["allow_category"]
-            return torrent_category
-        else:
-            return None
-    else:
-        return None
+def paginate(blocks: list[str], page_size: int, max_length: int = MESSAGE_MAX_LENGTH) -> list[str]:
+    """Join text blocks into pages of at most page_size blocks that fit into one Telegram message"""
+    pages: list[str] = []
+    page: list[str] = []
+    length = 0
+    for block in blocks:
+        block = block[:max_length]
+        if page and (len(page) >= page_size or length + len(block) > max_length):
+            pages.append("".join(page))
+            page = []
+            length = 0
+        page.append(block)
+        length += len(block)
+    if page:
+        pages.append("".join(page))
+    return pages
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Report a finished torrent to the bot completion endpoint.
+
+Standard library only, copy it next to the torrent client and make it executable.
+
+Transmission: set script-torrent-done-filename to this file, the torrent hash and id are read from
+TR_TORRENT_HASH and TR_TORRENT_ID.
+qBittorrent: run external program on torrent finished: /path/to/torrent_done.py %K
+
+The endpoint is http://host:port/complete or unix:///path/to/socket, taken from --url or TORRENT_BOT_EVENTS_URL.
+With several torrent clients pass the client name from the bot config with --client or TORRENT_BOT_CLIENT.
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import sys
+from urllib.parse import urlencode, urlparse
+
+DEFAULT_URL = "http://127.0.0.1:9101/complete"
+COMPLETE_PATH = "/complete"
+TIMEOUT = 5.0
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Report a finished torrent to torrent telegram bot")
+    parser.add_argument("hash", nargs="?", default=os.environ.get("TR_TORRENT_HASH"), help="torrent info hash")
+    parser.add_argument("--id", default=os.environ.get("TR_TORRENT_ID"), help="torrent id in the torrent client")
+    parser.add_argument("--client", default=os.environ.get("TORRENT_BOT_CLIENT"), help="client name in the bot config")
+    parser.add_argument("--url", default=os.environ.get("TORRENT_BOT_EVENTS_URL", DEFAULT_URL), help="bot endpoint")
+    args = parser.parse_args()
+
+    # qBittorrent passes "-" for a missing v1 hash
+    params = {name: value for name, value in (("hash", args.hash), ("id", args.id), ("client", args.client)) if value}
+    if params.get("hash") == "-":
+        del params["hash"]
+    if "hash" not in params and "id" not in params:
+        parser.error("torrent hash or id is required")
+
+    url = urlparse(args.url)
+    if url.scheme == "unix":
+        connection: http.client.HTTPConnection = UnixHTTPConnection(url.path)
+        path = COMPLETE_PATH
+    else:
+        connection = http.client.HTTPConnection(url.hostname or "127.0.0.1", url.port, timeout=TIMEOUT)
+        path = url.path or COMPLETE_PATH
+    try:
+        connection.request(
+            "POST", path, body=urlencode(params), headers={"Content-Type": "application/x-www-form-urlencoded"}
+        )
+        response = connection.getresponse()
+        response.read()
+    except OSError as exc:
+        sys.stderr.write(f"Torrent telegram bot is not reachable at {args.url}: {type(exc).__name__}({exc})\n")
+        return 1
+    finally:
+        connection.close()
+    if response.status != http.client.ACCEPTED:
+        sys.stderr.write(f"Torrent telegram bot rejected the event: {response.status} {response.reason}\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
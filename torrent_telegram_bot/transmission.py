@@ -1,9 +1,32 @@
+from collections.abc import Iterable
+from time import monotonic
+
 from transmission_rpc import Client
 
-from torrent_telegram_bot.custom_types import Torrent
+from torrent_telegram_bot.client import DEFAULT_WORKERS, TorrentClient
+from torrent_telegram_bot.custom_types import FIELDS_ALL, Torrent
+
+# transmission reports torrents as recently active for 60 seconds, older deltas need a full resync.
+# Syncs further apart than this, e.g. a schedule.check_period above it, always fetch every torrent
+DELTA_MAX_AGE = 45
+FULL_SYNC_PERIOD = 600
+
+RPC_FIELDS = {
+    "torrent_id": "id",
+    "name": "name",
+    "done_date": "doneDate",
+    "status": "status",
+    "eta": "eta",
+    "progress": "percentDone",
+    "download_speed": "rateDownload",
+    "upload_speed": "rateUpload",
+    "num_seeds_download": "peersSendingToUs",
+    "num_seeds_upload": "peersGettingFromUs",
+    "ratio": "uploadRatio",
+}
 
 
-class Transmission:
+class Transmission(TorrentClient):
     """Simple torrent client class"""
 
     def __init__(
@@ -12,74 +35,113 @@ class Transmission:
         port: int = 9091,
         user: str = "",
         password: str = "",
+        workers: int = DEFAULT_WORKERS,
+        name: str = "",
     ):
+        super().__init__(workers=workers, name=name)
         self.address = address
         self.port = port
         self.user = user
         self.password = password
         self.client = self.__get_client()
+        self.synced_at: float | None = None
+        self.full_synced_at = 0.0
+        self.transferring: set[str] = set()
+        self.fields: set[str] = set()
 
     def __get_client(self) -> Client:
         """Construct transmission client instance"""
         return Client(host=self.address, port=self.port, username=self.user, password=self.password)
 
-    def get_torrents(self) -> list[Torrent]:
-        """Get all torrents from client"""
-        torrents = self.client.get_torrents()
-        return [
-            Torrent(
-                torrent_id=str(torrent.id),
-                name=torrent.name,
-                done_date=torrent.done_date,
-                eta=torrent.eta,
-                status=torrent.status,
-                progress=torrent.progress,
-                download_speed=torrent.rate_download,
-                upload_speed=torrent.rate_upload,
-                num_seeds_download=torrent.peers_sending_to_us,
-                num_seeds_upload=torrent.peers_getting_from_us,
-                ratio=torrent.ratio,
-            )
-            for torrent in torrents
-        ]
+    def __arguments(self, fields: Iterable[str]) -> list[str]:
+        """Map torrent attributes to transmission RPC field names"""
+        return [RPC_FIELDS[field] for field in fields]
+
+    def __update(self, torrent: Torrent) -> str:
+        self.mirror[torrent.torrent_id] = torrent
+        if torrent.download_speed or torrent.upload_speed:
+            self.transferring.add(torrent.torrent_id)
+        else:
+            self.transferring.discard(torrent.torrent_id)
+        return torrent.torrent_id
 
-    def get_torrent(self, torrent_id: str) -> Torrent | None:
+    async def sync(self, fields: Iterable[str] = FIELDS_ALL) -> dict[str, Torrent]:
+        """Update local mirror with torrents from the recently-active feed, falling back to a full fetch.
+
+        The mirror holds the union of the fields requested since the last periodic full fetch, asking for a new
+        field forces a full fetch. The periodic full fetch narrows the mirror back to the fields of its caller.
+        """
+        async with self.sync_lock:
+            now = monotonic()
+            if now - self.full_synced_at > FULL_SYNC_PERIOD:
+                self.fields = set(fields)
+                self.synced_at = None
+            elif not self.fields.issuperset(fields):
+                self.fields |= set(fields)
+                self.synced_at = None
+            arguments = self.__arguments(self.fields)
+            try:
+                if (
+                    self.synced_at is None
+                    or now - self.synced_at > DELTA_MAX_AGE
+                    or now - self.full_synced_at > FULL_SYNC_PERIOD
+                ):
+                    torrents = await self.run(self.client.get_torrents, arguments=arguments)
+                    self.mirror.clear()
+                    self.transferring.clear()
+                    for torrent in torrents:
+                        self.__update(Torrent.from_transmission(torrent.fields))
+                    self.full_synced_at = now
+                else:
+                    active, removed = await self.run(self.client.get_recently_active_torrents, arguments=arguments)
+                    active_ids = {self.__update(Torrent.from_transmission(torrent.fields)) for torrent in active}
+                    for removed_id in removed:
+                        self.mirror.pop(str(removed_id), None)
+                        self.transferring.discard(str(removed_id))
+                    # torrents that dropped out of the feed have not transferred data for a while
+                    for torrent_id in self.transferring - active_ids:
+                        torrent = self.mirror.get(torrent_id)
+                        if torrent is not None:
+                            self.__update(
+                                torrent._replace(
+                                    download_speed=0, upload_speed=0, num_seeds_download=0, num_seeds_upload=0
+                                )
+                            )
+                        else:
+                            self.transferring.discard(torrent_id)
+            except Exception:
+                self.synced_at = None
+                raise
+            self.synced_at = now
+            return self.mirror
+
+    async def get_torrents_by_ids(
+        self, torrent_ids: Iterable[str], fields: Iterable[str] = FIELDS_ALL
+    ) -> list[Torrent]:
+        """Get torrents by torrent ids with a single request"""
+        ids = [int(torrent_id) for torrent_id in torrent_ids]
+        if not ids:
+            return []
+        torrents = await self.run(self.client.get_torrents, ids=ids, arguments=self.__arguments(fields))
+        return [Torrent.from_transmission(torrent.fields) for torrent in torrents]
+
+    async def get_torrent(self, torrent_id: str, fields: Iterable[str] = FIELDS_ALL) -> Torrent | None:
         """Get torrent by torrent id"""
-        torrent = self.client.get_torrent(int(torrent_id))
-        return Torrent(
-            torrent_id=str(torrent.id),
-            name=torrent.name,
-            done_date=torrent.done_date,
-            eta=torrent.eta,
-            status=torrent.status,
-            progress=torrent.progress,
-            download_speed=torrent.rate_download,
-            upload_speed=torrent.rate_upload,
-            num_seeds_download=torrent.peers_sending_to_us,
-            num_seeds_upload=torrent.peers_getting_from_us,
-            ratio=torrent.ratio,
-        )
-
-    def remove_torrent(self, torrent_id: str, delete_data: bool = True):
+        torrents = await self.get_torrents_by_ids([torrent_id], fields=fields)
+        if torrents:
+            return torrents[0]
+        return None
+
+    async def remove_torrent(self, torrent_id: str, delete_data: bool = True):
         """Remove torrent by torrent id"""
-        return self.client.remove_torrent(ids=int(torrent_id), delete_data=delete_data)
+        return await self.run(self.client.remove_torrent, ids=int(torrent_id), delete_data=delete_data)
 
-    def add_torrent(self, torrent_data: bytes, **kwargs) -> Torrent:
-        """Add torrent to client"""
+    async def add_torrent(self, torrent_data: bytes | str, **kwargs) -> Torrent:
+        """Add torrent file content or magnet link to client"""
         if "download_dir" in kwargs:
-            torrent = self.client.add_torrent(torrent=torrent_data, download_dir=kwargs.get("download_dir"))
+            torrent = await self.run(
+                self.client.add_torrent, torrent=torrent_data, download_dir=kwargs.get("download_dir")
+            )
         else:
-            torrent = self.client.add_torrent(torrent=torrent_data)
-        return Torrent(
-            torrent_id=str(torrent.id),
-            name=torrent.name,
-            done_date=None,
-            eta=None,
-            status="",
-            progress=0,
-            download_speed=0,
-            upload_speed=0,
-            num_seeds_download=0,
-            num_seeds_upload=0,
-            ratio=0,
-        )
+            torrent = await self.run(self.client.add_torrent, torrent=torrent_data)
+        return Torrent.from_transmission(torrent.fields)